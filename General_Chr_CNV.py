@@ -9,10 +9,23 @@ import pandas as pd
 import numpy as np
 import matplotlib
 import seaborn as sns
-from sklearn.decomposition import PCA
 from collections import defaultdict
 from matplotlib import pyplot as plt
 from sklearn import preprocessing
+from cnv_segments import is_sorted, segment_lengths
+from cohort_loader import prefetch_cohorts, read_pan_cancer_segments
+from arm_events import arm_breakpoints, arm_event_matrix, arm_scores, classify, event_name, group_lists, \
+    sample_cohorts
+from arm_events import remove_normal_samples as remove_normal_segments
+from gene_filters import remove_genes
+from dge_batch import batch_dge, write_dge_tables
+from permutation import permutation_test
+from instability_scan import association_scan
+from pca_tools import fit_pca
+from plotting import pca_figure, render_figures
+from arm_cooccurrence import cooccurrence_by_cohort
+from cnv_bootstrap import bootstrap_groups
+from normalization import cached_transform
 # for linux server
 matplotlib.use("Agg")
 
@@ -38,9 +51,9 @@ def pca_scatter(pca, standardised_values, classifs):
     plt.savefig("PCA_groups.png")
 
 
-def pca_plot(df, cnv):
-    pca = PCA(n_components=4, whiten=True)
-    transf = pca.fit_transform(df)
+def pca_plot(df, cnv, solver="auto"):
+    pca = fit_pca(df.T, n_components=4, whiten=True, solver=solver)
+    transf = pca.transformed
     variance_ratio = pca.explained_variance_ratio_
     loadings = pca.components_
     # fig_sample = plt.gcf()
@@ -106,10 +119,7 @@ class Aneuploidy:
         print(self.cancer, "patients' sample number:", len(self.snp_patients.index.tolist()))
         # filter keratin and immune genes if needed
         if immune == True:
-            immune_keratin_genes = pd.read_excel("/home/rshen/genomic_instability/keratin_immune_etc.xlsx", sheetname="Table S4")
-            immune_keratin_gene_list = immune_keratin_genes["Gene"].tolist()
-            immune_keratin_gene_list_ = list(filter(lambda i : i in self.rsem.index.tolist(), immune_keratin_gene_list))
-            self.rsem.drop(immune_keratin_gene_list_, axis=0, inplace=True)
+            self.rsem = remove_genes(self.rsem, "keratin_immune")
             print("immune_keratin_genes removed.")
         return self.snp_patients
 
@@ -122,77 +132,27 @@ class Aneuploidy:
         :param threshold_end: the end point to cut off the specific chromosomal arm
         :return: return two lists of samples, first list with the cnv, second list without the cnv
         """
-        self.snp_patients = self.snp_patients.sortlevel()
-        index_ = set(filter(lambda x: x[1] == self.chr, self.snp_patients.index.tolist()))
+        if not is_sorted(self.snp_patients):
+            self.snp_patients = self.snp_patients.sort_index()
+        chr_patients = self.snp_patients[self.snp_patients.index.get_level_values(1) == self.chr]
+        index_ = set(chr_patients.index.unique().tolist())
         print("length_index_chr"+str(self.chr)+": ", len(index_))
-        if self.arm == "":
-            for i in index_:
-                segment_lengths = np.array(self.snp_patients.loc[i].End-self.snp_patients.loc[i].Start)
-                segment_means = np.array(self.snp_patients.loc[i].Segment_Mean)
-                check = np.dot(segment_lengths,segment_means)/sum(segment_lengths)
-                if self.cond == "loss":
-                    if check < -threshold:
-                        self.altered_chr.append(i[0])
-                    elif -threshold<check<threshold:
-                        self.normal_chr.append(i[0])
-                elif self.cond == "gain":
-                    if check > threshold:
-                        self.altered_chr.append(i[0])
-                    elif -threshold<check<threshold:
-                        self.normal_chr.append(i[0])
-        elif self.arm == "p":
-            for i in index_:
-                segment_ends = np.array(self.snp_patients.loc[i].End)
-                segment_starts = np.array(self.snp_patients.loc[i].Start)
-                segment_means = np.array(self.snp_patients.loc[i].Segment_Mean)
-                # select the probes testing the interested chromosomal arm
-                segment_end = np.array(list(filter(lambda x: x < threshold_end, segment_ends)) + [threshold_end])
-                segment_start = segment_starts[:len(segment_end)]
-                segment_lengths = segment_end - segment_start
-                segment_length = np.array(list(filter(lambda x: x > 0, segment_lengths)))
-                segment_mean = segment_means[:len(segment_length)]
-                check = np.dot(segment_length,segment_mean)/sum(segment_length)              
-                if self.cond == "loss":
-                    if check < -threshold:
-                        self.altered_chr.append(i[0])
-                    elif -threshold<check<threshold:
-                        self.normal_chr.append(i[0])
-                elif self.cond == "gain":
-                    if check > threshold:
-                        self.altered_chr.append(i[0])
-                    elif -threshold<check<threshold:
-                        self.normal_chr.append(i[0])
-        elif self.arm == "q":
-            for i in index_:
-                segment_ends = np.array(self.snp_patients.loc[i].End)
-                segment_starts = np.array(self.snp_patients.loc[i].Start)
-                segment_means = np.array(self.snp_patients.loc[i].Segment_Mean)
-                segment_start = np.array(list(filter(lambda x: x > threshold_start, segment_starts)) + [threshold_start])
-                segment_end = segment_ends[::-1][:len(segment_start)]
-                segment_lengths = segment_end - segment_start
-                segment_length = np.array(list(filter(lambda x: x > 0, segment_lengths)))
-                segment_mean = segment_means[::-1][:len(segment_length)]
-                check = np.dot(segment_length,segment_mean)/sum(segment_length)
-                if self.cond == "loss":
-                    if check < -threshold:
-                        self.altered_chr.append(i[0])
-                    elif -threshold<check<threshold:
-                        self.normal_chr.append(i[0])
-                elif self.cond == "gain":
-                    if check > threshold:
-                        self.altered_chr.append(i[0])
-                    elif -threshold<check<threshold:
-                        self.normal_chr.append(i[0])
+        # the same arm windows and scores as the event matrix of arm_events, so both give the same groups
+        chr_arm = (self.chr, self.arm)
+        scores = arm_scores(chr_patients, [chr_arm], {chr_arm: (threshold_start, threshold_end)}).iloc[:, 0]
+        groups = classify(scores.values, self.cond, threshold)
+        self.altered_chr += scores.index[groups == 1].tolist()
+        self.normal_chr += scores.index[groups == 0].tolist()
         
         print(self.cancer+"_chr_"+str(self.chr)+self.arm+self.cond+"cnv samples #: ", len(self.altered_chr)/len(index_), '\n',
               self.cancer+" normal samples #: ", len(self.normal_chr)/len(index_))
         return self.altered_chr, self.normal_chr
 
     def calculate_Instability_score(self):
-        sample_index = set([x[0] for x in self.snp_patients.index.tolist()])
+        sample_index = set(self.snp_patients.index.get_level_values(0).unique().tolist())
         print("Number of patient samples to calculate instability score:", len(sample_index))
         for i in sample_index:
-            segments_lens = np.array(self.snp_patients.loc[i].End - self.snp_patients.loc[i].Start)
+            segments_lens = segment_lengths(self.snp_patients.loc[i])
             segments_means = np.array(abs(self.snp_patients.loc[i].Segment_Mean))
             instability_score = np.dot(segments_lens, segments_means)
             skimmed_index = "-".join(i.split("-")[0:4])
@@ -206,6 +166,25 @@ class Aneuploidy:
         self.Iscore.sort_values(axis=0, by="instability_score", ascending=False, inplace=True)
         self.Instability_score_samples = self.rsem[self.Iscore.index.tolist()]
 
+    def instability_scan(self, arm_score_df=None, method="spearman"):
+        """
+
+        Correlate the expression of every gene with the instability scores of the samples
+        (after calculate_Instability_score), results in <wd><cancer>_Instability_scan_*.npy
+
+        :param arm_score_df: samples x arms scores (arm_events.arm_scores) to scan together with the instability score
+        :param method: pearson or spearman
+        :return: the prefix of the output files, read them with instability_scan.read_scan
+        """
+        scores = self.Iscore
+        if arm_score_df is not None:
+            arm_score_df = arm_score_df.copy()
+            arm_score_df.index = ["-".join(x.split("-")[0:4]) for x in arm_score_df.index]
+            arm_score_df = arm_score_df.loc[~arm_score_df.index.duplicated()]
+            scores = scores.join(arm_score_df, how="left")
+        return association_scan(self.Instability_score_samples, scores,
+                                self.wd+self.cancer+"_Instability_scan", method=method)
+
     def set_samples_altered(self, indexCol):
         samples = []
         try:
@@ -264,34 +243,59 @@ class Aneuploidy:
         #self.Iscore.to_csv(self.wd+self.cancer+"_Instability_Score_" + ".txt", sep="\t")
         #self.Instability_score_samples.to_csv(self.wd+self.cancer+"_Instability_Score_samples" + ".txt", sep="\t")
 
-    def PCA_plot(self):
-        pca = PCA(n_components=4, whiten=True)
-        transf = pca.fit_transform(self.samples_target.T)
-        variance_ratio = pca.explained_variance_ratio_
-        loadings = pca.components_
-        fig_sample = plt.gcf()
-        fig_sample.set_size_inches(14,14)
-        #print(transf)
-        plt.xlabel("PC1: " + str(round(variance_ratio[0],3)))
-        plt.ylabel("PC2: " + str(round(variance_ratio[1],3)))
-        colName = self.samples_target.columns.tolist()
-        for n in range(len(colName)):
-            if (colName[n] in self.altered_chr):
-                altered, = plt.plot(transf[n,0],transf[n,1], marker='o', markersize=8, color='red', alpha=1, label="chromosome"+str(self.chr)+self.arm+"_"+self.cond)
-            if (colName[n] in self.normal_chr):
-                normal, = plt.plot(transf[n,0],transf[n,1], marker='o', markersize=8, color='blue', alpha=1, label='normal_samples')
-        plt.legend(loc='best', scatterpoints=1, handles=[altered, normal])
-        plt.title("PCA_plot_" + self.cancer + "_"  + str(self.chr)+self.arm+"_"+self.cond)
-        fig_sample.savefig(self.wd+"PCA_" + self.cancer + '_' + str(self.chr)+self.arm+"_"+self.cond + "_Jan_22.png", dpi=100)
-        PCA_loadings = pd.DataFrame(loadings, index=["PC1", "PC2","PC3","PC4"], columns=self.samples_target.index.tolist())
-    #        print(self.cancer, "loadings", loadings)
-        PCA_loadings.to_csv(self.wd+self.cancer + "_" +str(self.chr)+self.arm+"_"+self.cond +"_PCA_loadings_Jan_22.txt", sep="\t")
+    def permutation_test(self, n_perm=10000, log=True, processes=None):
+        """
 
+        Empirical p-values of the expression differences between the altered and normal samples,
+        from the permutations of the YES/NO labels in chr_category
 
-def GNI(tumor, chr, arm, var, seg, RNA_, CNV_cutoff, start, end, wdir):
+        :param n_perm: number of permutations
+        :param log: log2(x+1) transform the RNA data (raw counts) before the test
+        :param processes: number of worker processes, all cores if None
+        :return: data frame of the t statistic, p-value and adjusted p-value of each gene
+        """
+        expression = np.log2(self.samples_target + 1) if log else self.samples_target
+        labels = self.chr_category.iloc[:, 0]
+        self.permutation_p = permutation_test(expression, labels, n_perm=n_perm, processes=processes)
+        print(self.cancer+"_chr_"+str(self.chr)+self.arm+self.cond, "permutation test done:",
+              (self.permutation_p.padj < 0.05).sum(), "genes with padj < 0.05")
+        return self.permutation_p
+
+    def PCA_plot(self, solver="auto", render=True, transform=None):
+        """
+        PCA plot of the altered and normal samples
+        :param solver: full, randomized or incremental, see pca_tools.fit_pca
+        :param render: draw the plot now, otherwise return the plotting job for plotting.render_figures
+        :param transform: normalized, log or vst transform of the raw counts (normalization.cached_transform),
+                          the samples as they are if None
+        """
+        expression = self.samples_target
+        if transform is not None:
+            expression = cached_transform(self.samples_target, self.cancer, transform, cache_dir=self.wd+"norm_cache")
+        pca = fit_pca(expression, n_components=4, whiten=True, solver=solver, cache_dir=self.wd+"pca_cache")
+        PCA_loadings = pd.DataFrame(pca.components_, index=["PC1", "PC2","PC3","PC4"], columns=self.samples_target.index.tolist())
+        PCA_loadings.to_csv(self.wd+self.cancer + "_" +str(self.chr)+self.arm+"_"+self.cond +"_PCA_loadings_Jan_22.txt", sep="\t")
+        colName = np.array(self.samples_target.columns.tolist())
+        groups = np.where(np.isin(colName, self.altered_chr), "altered",
+                          np.where(np.isin(colName, self.normal_chr), "normal", ""))
+        job = (pca_figure, {"transformed": pca.transformed, "variance_ratio": pca.explained_variance_ratio_,
+                            "groups": groups, "colors": {"altered": "red", "normal": "blue"},
+                            "labels": {"altered": "chromosome"+str(self.chr)+self.arm+"_"+self.cond, "normal": "normal_samples"},
+                            "title": "PCA_plot_" + self.cancer + "_"  + str(self.chr)+self.arm+"_"+self.cond,
+                            "out_file": self.wd+"PCA_" + self.cancer + '_' + str(self.chr)+self.arm+"_"+self.cond + "_Jan_22.png"})
+        if render:
+            return job[0](**job[1])
+        return job
+
+
+def GNI(tumor, chr, arm, var, seg, RNA_, CNV_cutoff, start, end, wdir, groups=None):
     aneuploidy = Aneuploidy(tumor, RNA_, seg, chr, arm, var, wdir)
     aneuploidy.remove_normal_samples(False)
-    if (arm == "p"):
+    if groups is not None:
+        # the altered and normal samples of the event matrix, the same groups as the batch DGE tables
+        aneuploidy.altered_chr, aneuploidy.normal_chr = list(groups[0]), list(groups[1])
+        print(tumor+"_chr_"+str(chr)+arm+var+" cnv samples #: ", len(groups[0]), " normal samples #: ", len(groups[1]))
+    elif (arm == "p"):
         aneuploidy.chr_CNV(threshold=CNV_cutoff, threshold_start=start, threshold_end=end)
     elif (arm == "q"):
         aneuploidy.chr_CNV(threshold=CNV_cutoff, threshold_start=start, threshold_end=end)
@@ -319,71 +323,79 @@ if __name__ == '__main__':
     chr_arm_cufoff = {(3, ''): (0, 0), (6, 'q'): (6.0E7, 1.7E8), (8, 'p'): (2E7, 4.5E7), (9, 'p'): (5.0E7, 1.4E8), (6, 'p'): (1E6, 6.0E7),
                       (8, 'q'): (4.8E7, 1.5E8), (1, 'q'): (1.3E8, 2.5E8), (5, 'q'): (5E7, 1.8E8),  (18, 'q'): (1.9E7, 7.7E7)}
     
-    # read in the segment file and RNA data
-    BRCA_ = pd.read_table("/home/rshen/genomic_instability/chromosome8p/TCGA_data/BRCA__CNV.seg.txt", index_col=[0,1])
-    # BRCA_RNA = pd.read_table("/home/rshen/genomic_instability/chromosome8p/TCGA_data/BRCA_normalized_results_simplified.txt", index_col=0)
-    BRCA_RNA = pd.read_table("/home/rshen/genomic_instability/chromosome8p/TCGA_data/BRCA_genes_results_processed_raw_counts.txt", index_col=0)
-
-    SKCM_ = pd.read_table("/home/rshen/genomic_instability/chromosome8p/TCGA_data/SKCM__CNV.seg.txt", index_col=[0,1])
-    # SKCM_RNA = pd.read_table("/home/rshen/genomic_instability/chromosome8p/TCGA_data/SKCM_normalized_results_simplified.txt", index_col=0)
-    SKCM_RNA = pd.read_table("/home/rshen/genomic_instability/chromosome8p/TCGA_data/SKCM_genes_results_processed_raw_counts.txt", index_col=0)
-
-    UVM_ = pd.read_table("/home/rshen/genomic_instability/chromosome8p/TCGA_data/UVM__broad.mit.edu__genome_wide_snp_6__nocnv_hg19__Aug-04-2015.seg.txt", index_col=[0,1])
-    # UVM_RNA = pd.read_table("/home/rshen/genomic_instability/chromosome8p/TCGA_data/UVM_normalized_results_processed_No_keratin_immune.txt", index_col=0)
-    UVM_RNA = pd.read_table("/home/rshen/genomic_instability/chromosome8p/TCGA_data/UVM_raw_counts_.txt", index_col=0)
-
-    # for variation in chr_alter_dict.keys():
-    #     for chr_arm in chr_alter_dict[variation]:
-    #         aneuploidy = GNI("UVM0.2", chr_arm[0], chr_arm[1], variation, UVM_, UVM_RNA, 0.2, 
-    #                          start=chr_arm_cufoff[chr_arm][0], end=chr_arm_cufoff[chr_arm][1], wdir=wd)
-    #         # samples = aneuploidy.samples_target
-            # altered_chr = aneuploidy.altered_chr
-            # altered_samples = samples[altered_chr]
-            # standardized = preprocessing.scale(altered_samples).T
-            # standardized = pd.DataFrame(standardized, index=altered_samples.columns,
-            #                             columns=altered_samples.index)
-            # # screenplot(pca, standardized)
-            # # pca_scatter(pca, standardized, standardized.index)
-            # # pca_plot(standardized)
-            # pca_plot(altered_samples.T, str(chr_arm[0])+chr_arm[1]+variation)
-            # genomic_instability_df['{}_{}_{}'.format(chr_arm[0],chr_arm[1],variation)] = altered_samples.mean(axis=1)
-            # genomic_instability_df.to_csv(wd+"BRCA_GID_thres_0.2.txt", sep='\t')
-    
-
-    for variation in chr_alter_dict.keys():
-        for chr_arm in chr_alter_dict[variation]:
-            aneuploidy = GNI("BRCA0.2", chr_arm[0], chr_arm[1], variation, BRCA_, BRCA_RNA, 0.2, 
-                         start=chr_arm_cufoff[chr_arm][0], end=chr_arm_cufoff[chr_arm][1], wdir=wd)
-            # samples = aneuploidy.samples_target
-            # altered_chr = aneuploidy.altered_chr
-            # altered_samples = samples[altered_chr]
-            # standardized = preprocessing.scale(altered_samples).T
-            # standardized = pd.DataFrame(standardized, index=altered_samples.columns,
-            #                             columns=altered_samples.index)
-            # # screenplot(pca, standardized)
-            # # pca_scatter(pca, standardized, standardized.index)
-            # # pca_plot(standardized)
-            # pca_plot(altered_samples.T, str(chr_arm[0])+chr_arm[1]+variation)
-            # genomic_instability_df['{}_{}_{}'.format(chr_arm[0],chr_arm[1],variation)] = altered_samples.mean(axis=1)
-            # genomic_instability_df.to_csv(wd+"UVM_GID_thres_0.2.txt", sep='\t')
-    
-
-    # for variation in chr_alter_dict.keys():
-    #     for chr_arm in chr_alter_dict[variation]:
-    #         aneuploidy = GNI("SKCM0.2", chr_arm[0], chr_arm[1], variation, SKCM_, SKCM_RNA, 0.2, 
-    #                         start=chr_arm_cufoff[chr_arm][0], end=chr_arm_cufoff[chr_arm][1], wdir=wd)
-            # samples = aneuploidy.samples_target
-            # altered_chr = aneuploidy.altered_chr
-            # altered_samples = samples[altered_chr]
-            # standardized = preprocessing.scale(altered_samples).T
-            # standardized = pd.DataFrame(standardized, index=altered_samples.columns,
-            #                             columns=altered_samples.index)
-            # # screenplot(pca, standardized)
-            # # pca_scatter(pca, standardized, standardized.index)
-            # # pca_plot(standardized)
-            # pca_plot(altered_samples.T, str(chr_arm[0])+chr_arm[1]+variation)
-            # genomic_instability_df['{}_{}_{}'.format(chr_arm[0],chr_arm[1],variation)] = altered_samples.mean(axis=1)
-            # genomic_instability_df.to_csv(wd+"SKCM_GID_thres_0.2.txt", sep='\t')
+    # segment mean tolerance for merging the adjacent segments, 0 only merges the identical segment means
+    compact_tol = 0.0
+    # no merged segment spans an arm cut off, so the arm scores are the same as on the original segments
+    breakpoints = arm_breakpoints(chr_arm_cufoff)
+
+    # the segment file and RNA data of each cohort, the next cohort is read in while the current one is processed
+    data_dir = "/home/rshen/genomic_instability/chromosome8p/TCGA_data/"
+    cohorts = [("BRCA0.2", data_dir+"BRCA__CNV.seg.txt", data_dir+"BRCA_genes_results_processed_raw_counts.txt"),
+               ("SKCM0.2", data_dir+"SKCM__CNV.seg.txt", data_dir+"SKCM_genes_results_processed_raw_counts.txt"),
+               ("UVM0.2", data_dir+"UVM__broad.mit.edu__genome_wide_snp_6__nocnv_hg19__Aug-04-2015.seg.txt", data_dir+"UVM_raw_counts_.txt")]
+    # normalized counts
+    # BRCA_normalized_results_simplified.txt, SKCM_normalized_results_simplified.txt, UVM_normalized_results_processed_No_keratin_immune.txt
+
+    # PCA plots of all the arms, rendered in worker processes, on the cached VST of the raw counts
+    plot_pca = False
+    pca_transform = "vst"
+
+    # differential expression of all the arms in one pass, instead of DGEA in r_file.R for each arm
+    run_batch_dge = True
+
+    # pan-cancer mode: one concatenated segment file with a Cohort column, or a directory of segment files
+    pan_cancer_seg = ""
+    # bootstrap replicates for the stability of the grouping, 0 to skip
+    bootstrap_reps = 0
+
+    if pan_cancer_seg:
+        pan_seg = remove_normal_segments(read_pan_cancer_segments(pan_cancer_seg, compact_tol=compact_tol,
+                                                                   breakpoints=breakpoints))
+        cohort_of_sample = sample_cohorts(pan_seg)
+        events = arm_event_matrix(pan_seg, chr_alter_dict, chr_arm_cufoff, 0.2)
+        cnv_groups = group_lists(events, cohort_of_sample)
+        for cancer in sorted(cnv_groups.keys()):
+            for cnv in sorted(cnv_groups[cancer].keys()):
+                print(cancer, cnv, "altered samples #:", len(cnv_groups[cancer][cnv][0]),
+                      "normal samples #:", len(cnv_groups[cancer][cnv][1]))
+        if bootstrap_reps:
+            stability, group_sizes = bootstrap_groups(pan_seg, chr_alter_dict, chr_arm_cufoff, 0.2, n_rep=bootstrap_reps)
+            stability.to_csv(wd+"pan_cancer_call_stability_thres_0.2.txt", sep="\t")
+            group_sizes.to_csv(wd+"pan_cancer_group_sizes_thres_0.2.txt", sep="\t")
+        cooccurrence_by_cohort(events, cohort_of_sample).to_csv(wd+"pan_cancer_arm_cooccurrence_thres_0.2.txt",
+                                                               sep="\t", index=False)
+        events.insert(0, "Cohort", cohort_of_sample.reindex(events.index).values)
+        events.to_csv(wd+"pan_cancer_arm_events_thres_0.2.txt", sep="\t")
+    else:
+        pca_jobs = []
+        for cohort in prefetch_cohorts(cohorts, compact_tol=compact_tol, breakpoints=breakpoints):
+            # one grouping of the cohort for both the batch DGE tables and the GNI outputs
+            events = arm_event_matrix(remove_normal_segments(cohort.seg), chr_alter_dict, chr_arm_cufoff, 0.2)
+            cnv_groups = group_lists(events)["all"]
+            if run_batch_dge:
+                write_dge_tables(batch_dge(cohort.rna, events), wd, cohort.name)
+            for variation in chr_alter_dict.keys():
+                for chr_arm in chr_alter_dict[variation]:
+                    aneuploidy = GNI(cohort.name, chr_arm[0], chr_arm[1], variation, cohort.seg, cohort.rna, 0.2,
+                                     start=chr_arm_cufoff[chr_arm][0], end=chr_arm_cufoff[chr_arm][1], wdir=wd,
+                                     groups=cnv_groups[event_name(chr_arm[0], chr_arm[1], variation)])
+                    if plot_pca:
+                        pca_jobs.append(aneuploidy.PCA_plot(render=False, transform=pca_transform))
+                    # samples = aneuploidy.samples_target
+                    # altered_chr = aneuploidy.altered_chr
+                    # altered_samples = samples[altered_chr]
+                    # standardized = preprocessing.scale(altered_samples).T
+                    # standardized = pd.DataFrame(standardized, index=altered_samples.columns,
+                    #                             columns=altered_samples.index)
+                    # # screenplot(pca, standardized)
+                    # # pca_scatter(pca, standardized, standardized.index)
+                    # # pca_plot(standardized)
+                    # pca_plot(altered_samples.T, str(chr_arm[0])+chr_arm[1]+variation)
+                    # genomic_instability_df['{}_{}_{}'.format(chr_arm[0],chr_arm[1],variation)] = altered_samples.mean(axis=1)
+                    # genomic_instability_df.to_csv(wd+cohort.name+"_GID_thres_0.2.txt", sep='\t')
+            # release the last arm of the cohort, also when no arm was run
+            aneuploidy = None
+        render_figures(pca_jobs)
 
     # calculate instability scores
     """
@@ -30,40 +30,6 @@ def uniquify(df_columns):
         seen.add(newitem)
     return list(seen)
 
-#　draw correlation heatmap
-
-"""
-def hinton(matrix, max_weight=None, ax=None):
-
-    ax = ax if ax is not None else plt.gca()
-
-    if not max_weight:
-        max_weight = 2 ** np.ceil(np.log(np.abs(matrix).max()) / np.log(2))
-
-    ax.patch.set_facecolor('lightgray')
-    ax.set_aspect('equal', 'box')
-    ax.xaxis.set_major_locator(plt.NullLocator())
-    ax.yaxis.set_major_locator(plt.NullLocator())
-
-    for (x, y), w in np.ndenumerate(matrix):
-        color = 'red' if w > 0 else 'blue'
-        size = np.sqrt(np.abs(w))
-        rect = plt.Rectangle([x - size / 2, y - size / 2], size, size,
-                             facecolor=color, edgecolor=color)
-        ax.add_patch(rect)
-
-    nticks = matrix.shape[0]
-    ax.xaxis.tick_top()
-    ax.set_xticks(range(nticks))
-    ax.set_xticklabels(list(matrix.columns), rotation=90)
-    ax.set_yticks(range(nticks))
-    ax.set_yticklabels(matrix.columns)
-    ax.grid(False)
-
-    ax.autoscale_view()
-    ax.invert_yaxis()
-"""
-
 
 def screenplot(pca, standardised_values):
     y = np.std(pca.transform(standardised_values), axis=0)**2
@@ -460,7 +426,7 @@ if __name__ == '__main__':
 
     # correlation approach doesn't work at all
     """
-    corrmat = genomic_instability_df.corr()
+    corrmat, corr_p_value, corr_n = correlation_matrix(genomic_instability_df)
     corrmat.to_csv(self.wd+"corr_only.txt", sep='\t')
     print("corrmat finished")
     # fig1 = plt.figure()
@@ -471,13 +437,11 @@ if __name__ == '__main__':
     hinton(corrmat)
     plt.savefig(self.wd+"genomic_instability_corr_hinton.png", dpi=200, bbox_inches='tight')
 
-    correlation_p_value = pd.DataFrame()
-    # correlation_p_value.set_index(['p-value','corr'])
-    for i in (genomic_instability_df.columns):
-        for j in (genomic_instability_df.columns):
-            correlation_p_value['{}_{}'.format(i, j)] = stats.pearsonr(genomic_instability_df[i],
-                                                                       genomic_instability_df[j])
+    # pearson correlation (first row) and p-value (second row) of each pair of columns
+    pairs = ['{}_{}'.format(i, j) for i in corrmat.index for j in corrmat.columns]
+    correlation_p_value = pd.DataFrame([corrmat.values.ravel(), corr_p_value.values.ravel()], columns=pairs)
     correlation_p_value.to_csv(self.wd+"corr_p_val.txt", sep='\t')
+    correlation_table(genomic_instability_df).to_csv(self.wd+"corr_p_val_fdr.txt", sep='\t', index=False)
     print("pearson finished")
     """
     """
@@ -6,13 +6,25 @@ Created on Wed Oct  5 10:20:33 2016
 """
 
 import pandas as pd
-from os.path import join
-from os import walk, listdir
-from collections import defaultdict
+from os.path import exists, join
 
+from dge_batch import find_dge_tables, gsea_signature, read_dge_tables
+from gene_sets import read_gmt, score_gene_sets
+from gsea import preranked_gsea, write_reports
+from gsea_index import gsea_index, result_matrix, run_results
+from ora import overrepresentation, top_bottom_queries
+from rrho import export_rrho_tsv, rrho_map, write_rrho_pairs
 
-def generate_rrho_file(input_file, wd):
+
+def generate_rrho_file(input_file, wd, binary=False, export_tsv=False, processes=None):
     rf = pd.read_table(input_file, index_col=0)
+    if binary:
+        # every signature ranked once, all the pairs in one container
+        output_fo = join(wd, "RRHO_pairs.npz")
+        write_rrho_pairs(rf, output_fo)
+        if export_tsv:
+            export_rrho_tsv(output_fo, wd, processes=processes)
+        return output_fo
     columns_ = rf.columns.tolist()
     for i in range(len(columns_)):
         for j in range(i+1, len(columns_)):
@@ -48,6 +60,19 @@ def generate_rrho_file_2(input_f1, input_f2, wd):
     rf.to_csv(output_fo, sep="\t", index=False)
 
 
+def rrho_map_2(input_f1, input_f2, wd, step=100):
+    # the RRHO map of two DGE results computed here instead of by the RRHO tool
+    rf1 = pd.read_table(input_f1, index_col=0)
+    rf2 = pd.read_table(input_f2, index_col=0)
+    cnv1 = input_f1.split("/")[-1].split("_")[0]
+    cnv2 = input_f2.split("/")[-1].split("_")[0]
+    rrho = rrho_map(rf1["log2FoldChange"].dropna(), rf2["log2FoldChange"].dropna(), step=step)
+    output_fo = join(wd, "RRHO_map_"+cnv1+"-"+cnv2+".txt")
+    rrho.to_csv(output_fo, sep="\t")
+    print("RRHO_map_"+cnv1+"-"+cnv2+".txt", "generated")
+    return rrho
+
+
 def generate_rrho_file_GSEA(input_f1, input_f2, wd1, wd2, wd):
     # rf1 = pd.read_table(join(wd1, input_f1), index_col=0)
     # rf2 = pd.read_table(join(wd2, input_f2), index_col=0)
@@ -85,86 +110,36 @@ def generate_rrho_file_GSEA(input_f1, input_f2, wd1, wd2, wd):
     
 
 def go_through_GSEA(wd):
-    gsea_dir = [x[1] for x in walk(wd)][0]
+    # every report parsed once by the index
+    index = gsea_index(wd)
+    gsea_dir = index["Run"].cat.categories.tolist()
+    results = dict((run, run_results(index, run)) for run in gsea_dir)
     for i in range(len(gsea_dir)):
-        na_pos = ''
-        na_neg = ''
-        files_i = listdir(join(wd,gsea_dir[i]))
-        wd_i = wd + gsea_dir[i]
-        for f in files_i:
-            if ("gsea_report_for_YES" in f) and (".xls" in f):
-                na_pos = f
-            if ("gsea_report_for_NO" in f) and (".xls" in f):
-                na_neg = f
-        df1 = pd.read_table(join(wd_i, na_pos), index_col=0)
-        df2 = pd.read_table(join(wd_i, na_neg), index_col=0)
-        df_i = pd.concat([df1, df2])
+        cnv1 = gsea_dir[i].split("_")[2:5]
         for j in range(i+1, len(gsea_dir)):
-            files_j = listdir(join(wd,gsea_dir[j]))
-            wd_j = wd + gsea_dir[j]
-            for f in files_j:
-                if ("gsea_report_for_YES" in f) and (".xls" in f):
-                    na_pos = f
-                if ("gsea_report_for_NO" in f) and (".xls" in f):
-                    na_neg = f
-            df1 = pd.read_table(join(wd_j, na_pos), index_col=0)
-            df2 = pd.read_table(join(wd_j, na_neg), index_col=0)
-            df_j = pd.concat([df1, df2])
-            cnv1 = gsea_dir[i].split("_")[2:5]
             cnv2 = gsea_dir[j].split("_")[2:5]
             if (cnv1[0] == cnv2[0] or cnv1[1] == cnv2[1]):
-                generate_rrho_file_GSEA(df_i, df_j, wd_i, wd_j, wd)
-            else:
-                continue
-
-
-def geneset_overlap_cancers(wd):
-    gsea_dir = [x[1] for x in walk(wd)][0]
-    all_cancer_cnv = pd.DataFrame()
-    for i in range(len(gsea_dir)):
-        cancer_cnv = '-'.join((gsea_dir[i].split('.')[0]).split('_')[2:])
-        na_pos = ''
-        na_neg = ''
-        files_i = listdir(join(wd, gsea_dir[i]))
-        wd_i = wd + gsea_dir[i]
-        for f in files_i:
-            if ("gsea_report_for_YES" in f or "gsea_report_for_na_pos" in f) and (".xls" in f):
-                na_pos = f
-            if ("gsea_report_for_NO" in f or "gsea_report_for_na_neg" in f) and (".xls" in f):
-                na_neg = f
-        df1 = pd.read_table(join(wd_i, na_pos), index_col=0)
-        df2 = pd.read_table(join(wd_i, na_neg), index_col=0)
-        df_i = pd.concat([df1, df2])
-        print(df_i['NES'])
-        if (len(all_cancer_cnv.index)):
-            all_cancer_cnv[cancer_cnv] = df_i['NES']
-        else:
-            all_cancer_cnv = pd.DataFrame(index=df_i.index)  
-            all_cancer_cnv[cancer_cnv] = df_i['NES']
-    
-    all_cancer_cnv.to_excel(wd+"All_cancers_CNV_NES_Score__.xlsx")
+                generate_rrho_file_GSEA(results[gsea_dir[i]], results[gsea_dir[j]],
+                                        join(wd, gsea_dir[i]), join(wd, gsea_dir[j]), wd)
+
+
+def geneset_overlap_cancers(wd, excel=False):
+    # gene sets x cancer-cnv NES, all the gene sets of all the runs are kept
+    all_cancer_cnv = result_matrix(gsea_index(wd), "NES")
+    print(all_cancer_cnv.shape[0], "gene sets in", all_cancer_cnv.shape[1], "cancer-cnv groups")
+    all_cancer_cnv.to_pickle(wd+"All_cancers_CNV_NES_Score__.pkl")
+    if excel:
+        all_cancer_cnv.to_excel(wd+"All_cancers_CNV_NES_Score__.xlsx")
+    return all_cancer_cnv
     
     
-def genes_overlaps_DGE(wd):
-    dge_dir = [x[1] for x in walk(wd)][0]
-    dge_df = pd.DataFrame()
-    for i in range(len(dge_dir)):
-        cancer = dge_dir[i].split("_")[0]
-        path_i = join(wd, dge_dir[i])
-        files_i = [f for f in listdir(path_i) if f.endswith('.txt')]
-        for f in files_i:
-            cnv = f.split("_")[0]
-            df_i = pd.read_table(join(path_i, f), index_col=0)
-            df_i = df_i[df_i.padj < 0.05]
-            if (len(dge_df.index)):
-                dge_df = pd.concat([dge_df, df_i.log2FoldChange.to_frame()], axis=1)
-                # dge_df.merge(df_i.log2FoldChange.to_frame(), left_on=dge_df.index, right_on=df_i.index, how="outer")
-                dge_df.rename(columns={"log2FoldChange" : cancer+cnv}, inplace=True)
-            else:
-                dge_df = pd.DataFrame(df_i.log2FoldChange)
-                dge_df.rename(columns={"log2FoldChange" : cancer+cnv}, inplace=True)
-                
-    dge_df.to_excel(wd+"cnv_dge_log2foldchange.xlsx")
+def genes_overlaps_DGE(wd, padj=0.05, excel=False):
+    # genes x cancer-cnv log2FoldChange of the significant genes, NaN where not significant
+    dge_df = read_dge_tables(wd, padj=padj)
+    dge_df.to_pickle(wd+"cnv_dge_log2foldchange.pkl")
+    if excel:
+        dge_df.sparse.to_dense().to_excel(wd+"cnv_dge_log2foldchange.xlsx")
+    return dge_df
 
 
 if __name__ == "__main__":
@@ -175,6 +150,7 @@ if __name__ == "__main__":
 #    filename = "GID.txt"
 #    input_f = join(wd, filename)
 #    generate_rrho_file(input_f, wd)
+#    generate_rrho_file(input_f, wd, binary=True)
 #    rank_rank_files = [x[2] for x in walk(wd)][0]
 #    for i in range(len(rank_rank_files)-2):
 #        for j in range(i+1, len(rank_rank_files)-2):
@@ -183,63 +159,59 @@ if __name__ == "__main__":
 #                print(file1)
 #                file2 = join(wd, rank_rank_files[j])
 #                generate_rrho_file_2(file1, file2, wd)
+#                rrho_map_2(file1, file2, wd)
     # =================================================================================================
 
 
     # GSEA threshold 0.2
     # ================================================================================================
 #    wd_gsea = "C:/Users/wesle/OneDrive/College/Graeber Lab/Genomic_instability/Winter_2017/Thres_0.2_GSEA_Immune/"
-#    geneset_overlap_cancers(wd_gsea)
+#    geneset_overlap_cancers(wd_gsea, excel=True)
     # ================================================================================================
     
     # DGE threshold 0.2
     wd_dge = "C:/Users/wesle/OneDrive/College/Graeber Lab/Genomic_instability/Winter_2017/Thres_0.2_DGE_All_Genes/"
 #    genes_overlaps_DGE(wd_dge)
-    cnv_dge = pd.read_excel("C:/Users/wesle/OneDrive/College/Graeber Lab/Genomic_instability/Winter_2017/Thres_0.2_DGE_All_Genes/cnv_dge_log2foldchange.xlsx", index_col=0, na_values=0)
-    cp_genesets = pd.read_table("C:/Users/wesle/OneDrive/College/Graeber Lab/Genomic_instability/Winter_2017/Thres_0.2_GSEA/c2.cp.v5.2.symbols.gmt", 
-                                dtype={"user_id": object, "username": object}, header=None, index_col=0)
+    # the pickle of genes_overlaps_DGE, or the excel table of the earlier runs
+    if exists(wd_dge+"cnv_dge_log2foldchange.pkl"):
+        cnv_dge = pd.read_pickle(wd_dge+"cnv_dge_log2foldchange.pkl").sparse.to_dense()
+    else:
+        cnv_dge = pd.read_excel(wd_dge+"cnv_dge_log2foldchange.xlsx", index_col=0, na_values=0)
+    cp_genesets = read_gmt("C:/Users/wesle/OneDrive/College/Graeber Lab/Genomic_instability/Winter_2017/Thres_0.2_GSEA/c2.cp.v5.2.symbols.gmt")
     
     # investigate the genesets upregulted/downregulated in the aneuploidy
     idx = cnv_dge.sum(axis=1).sort_values(ascending=False).index
     cnv_dge_ordered = cnv_dge.ix[idx]
     cnv_dge_ordered.fillna(0, inplace=True)
     # gene set dictionary
-    cp_genesets_dict_raw = cp_genesets.T.to_dict(orient='list')
-    genes_list = [[x for x in cp_genesets_dict_raw[k] if str(x) != "nan"] for k in cp_genesets_dict_raw]
-    cp_genesets_dict = dict(zip(cp_genesets_dict_raw.keys(), genes_list))
+    cp_genesets_dict = cp_genesets
     
-    """
     # select the first three thousand genes and last three thousand genes
-    # look for the gene sets composed by those genes
-    geneset_up = defaultdict(float)
-    geneset_down = defaultdict(float)
-    ordered_genes = cnv_dge_ordered.index.tolist()
-    up_regulated_genes = ordered_genes[:3000]
-    down_regulated_genes = ordered_genes[len(ordered_genes)-3000:]
-    for gene in up_regulated_genes:
-        for key, val in cp_genesets_dict.items():
-            if gene in val:
-                if len(set(cp_genesets_dict[key]).intersection(up_regulated_genes)) >= len(cp_genesets_dict[key]) / 2:
-                    geneset_up[key] = len(set(cp_genesets_dict[key]).intersection(up_regulated_genes)) / len(cp_genesets_dict[key])
-    
-    for gene in down_regulated_genes:
-        for key, val in cp_genesets_dict.items():
-            if gene in val:
-                if len(set(cp_genesets_dict[key]).intersection(down_regulated_genes)) >= len(cp_genesets_dict[key]) / 2:
-                    geneset_down[key] = len(set(cp_genesets_dict[key]).intersection(down_regulated_genes)) / len(cp_genesets_dict[key])
+    # look for the gene sets with at least half of their genes among them
+    run_ora = False
+    if run_ora:
+        ordered_genes = cnv_dge_ordered.index
+        ora = overrepresentation(cp_genesets_dict, top_bottom_queries(cnv_dge.sum(axis=1), n=3000), ordered_genes)
+        ora = ora[ora.Fraction >= 0.5]
+        geneset_up = ora[ora.Query == "up"].set_index("GeneSet")
+        geneset_down = ora[ora.Query == "down"].set_index("GeneSet")
+        geneset_up.to_csv(wd_dge+"geneset_up.txt", sep="\t")
+        geneset_down.to_csv(wd_dge+"geneset_down.txt", sep="\t")
+        # the same for every cnv signature at once
+        ora_signatures = overrepresentation(cp_genesets_dict, top_bottom_queries(cnv_dge, n=3000), ordered_genes)
+        ora_signatures.to_csv(wd_dge+"geneset_ora_signatures.txt", sep="\t", index=False)
     
-    geneset_up = pd.Series(geneset_up).to_frame()
-    geneset_down = pd.Series(geneset_down).to_frame()
-    geneset_up.to_csv(wd_dge+"geneset_up.txt", sep="\t")    
-    geneset_down.to_csv(wd_dge+"geneset_down.txt", sep="\t")    
-    """
+    # preranked GSEA of all the cnv signatures in one job, the reports are read back by gsea_index
+    run_gsea = False
+    if run_gsea:
+        all_dge = read_dge_tables(wd_dge, padj=float("inf"), sparse=False)
+        # the runs are named <cancer>_<arm>_<condition> for gsea_index
+        all_dge = all_dge.rename(columns=dict((s, gsea_signature(p)) for s, p in find_dge_tables(wd_dge)))
+        write_reports(preranked_gsea(all_dge, cp_genesets_dict, n_perm=1000), wd_dge+"GSEA/")
+        geneset_overlap_cancers(wd_dge+"GSEA/")
     
     # calculate the geneset scores for each cnv signatures
-    gene_set_scores = pd.DataFrame(index=cp_genesets.index, columns=cnv_dge.columns)
-
-    for i in gene_set_scores.index:
-        for c in gene_set_scores.columns:
-            gene_set_scores.loc[i,c] = (cnv_dge_ordered.loc[cp_genesets_dict[i], c]).sum()
+    gene_set_scores = score_gene_sets(cp_genesets_dict, cnv_dge_ordered, score="sum")
     
     gene_set_scores.to_csv(wd_dge+"gene_set_scores.txt", sep="\t")
     gene_set_scores_ordered = gene_set_scores.ix[gene_set_scores.sum(axis=1).sort_values().index]
@@ -0,0 +1,85 @@
+"""
+Co-occurrence and mutual exclusivity of the arm events (e.g. 8p loss with 8q gain) over the sample x arm event matrix,
+the 2x2 tables of all the arm pairs come from boolean matrix products, tested with vectorized hypergeometric tests
+"""
+
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from stat_utils import p_adjust_bh
+
+
+def pair_tables(events):
+    """
+    2x2 tables of all the pairs of events over the samples with both events called (0 or 1)
+    :param events: samples x events, 1 altered, 0 normal, NaN neither
+    :return: dict of events x events arrays: both (a), first only (b), second only (c), neither (d), n
+    """
+    values = np.asarray(events, dtype=np.float64)
+    altered = (values == 1).astype(np.float64)
+    called = (~np.isnan(values)).astype(np.float64)
+    n = called.T.dot(called)
+    both = altered.T.dot(altered)
+    first = altered.T.dot(called) - both
+    second = called.T.dot(altered) - both
+    return {"a": both, "b": first, "c": second, "d": n - both - first - second, "n": n}
+
+
+def fisher_two_sided(a, b, c, d):
+    """
+    two-sided Fisher exact test of many 2x2 tables at once (same as scipy.stats.fisher_exact)
+    """
+    a, b, c, d = [np.asarray(x, dtype=np.int64) for x in (a, b, c, d)]
+    n = a + b + c + d
+    row = a + b
+    col = a + c
+    lo = np.maximum(0, row + col - n)
+    hi = np.minimum(row, col)
+    p_obs = stats.hypergeom.pmf(a, n, row, col)
+    p = np.zeros(a.shape)
+    # sum the probabilities of all the tables as or less likely than the observed one
+    for x in range(int(hi.max()) + 1 if hi.size else 0):
+        in_support = (x >= lo) & (x <= hi)
+        p_x = stats.hypergeom.pmf(x, n, row, col)
+        p += np.where(in_support & (p_x <= p_obs * (1 + 1e-7)), p_x, 0.0)
+    return np.minimum(p, 1.0)
+
+
+def cooccurrence(events, min_samples=10):
+    """
+
+    Co-occurrence of every pair of arm events
+
+    :param events: samples x events, 1 altered, 0 normal, NaN neither
+    :param min_samples: leave out the pairs called in fewer samples
+    :return: data frame of the pairs with the 2x2 table, log odds ratio, one-sided co-occurrence and
+             mutual exclusivity p-values, two-sided Fisher p-value and its BH adjustment
+    """
+    tables = pair_tables(events)
+    i, j = np.triu_indices(events.shape[1], k=1)
+    a, b, c, d, n = [tables[x][i, j] for x in ("a", "b", "c", "d", "n")]
+    keep = n >= min_samples
+    i, j, a, b, c, d, n = i[keep], j[keep], a[keep], b[keep], c[keep], d[keep], n[keep]
+    result = pd.DataFrame({"event_1": events.columns[i], "event_2": events.columns[j],
+                           "both": a, "first_only": b, "second_only": c, "neither": d, "n": n})
+    result["log_odds_ratio"] = np.log((a + 0.5) * (d + 0.5) / ((b + 0.5) * (c + 0.5)))
+    result["p_cooccurrence"] = stats.hypergeom.sf(a - 1, n, a + b, a + c)
+    result["p_exclusivity"] = stats.hypergeom.cdf(a, n, a + b, a + c)
+    result["p_value"] = fisher_two_sided(a, b, c, d)
+    result["padj"] = p_adjust_bh(result["p_value"].values)
+    return result
+
+
+def cooccurrence_by_cohort(events, cohorts, min_samples=10):
+    """
+    co-occurrence of the arm events in each cohort and pan-cancer (cohort "PANCAN")
+    :param events: samples x events from arm_events.arm_event_matrix
+    :param cohorts: Series of sample to cohort
+    :return: data frame of the pairs of all the cohorts with a cohort column
+    """
+    cohorts = cohorts.reindex(events.index)
+    results = [cooccurrence(events, min_samples).assign(cohort="PANCAN")]
+    for cohort, sub_events in events.groupby(cohorts.values):
+        results.append(cooccurrence(sub_events, min_samples).assign(cohort=cohort))
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,201 @@
+"""
+Vectorized CNV scoring of all the samples in all the chromosome arms at once
+the sample x arm event matrix used by the pan-cancer mode of General_Chr_CNV
+"""
+
+
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from cnv_segments import segment_lengths
+
+
+# TCGA sample type codes of the normal samples
+NORMAL_SAMPLE_TYPES = ("10A", "10B", "11A", "11B", "12A", "12B", "13A", "13B", "14A", "14B")
+
+
+def arm_name(chromosome, arm):
+    return "{}{}".format(chromosome, arm)
+
+
+def event_name(chromosome, arm, cond):
+    return "{}{}_{}".format(chromosome, arm, cond)
+
+
+def remove_normal_samples(seg):
+    """
+    remove the samples of normal tissues from the segment data frame
+    :param seg: segment data frame indexed by (Sample, Chromosome)
+    :return: segment data frame of the patient samples
+    """
+    samples = pd.Series(seg.index.get_level_values(0).astype(str))
+    sample_type = samples.str.split("-").str[3]
+    return seg[~sample_type.isin(NORMAL_SAMPLE_TYPES).values]
+
+
+def arm_windows(chr_arms, chr_arm_cufoff):
+    """
+    the genomic window of each chromosome arm, the same cut offs as Aneuploidy.chr_CNV:
+    p arm from the chromosome start to the end cut off, q arm from the start cut off to the chromosome end
+    :param chr_arms: list of (chromosome, arm), arm is '' for the whole chromosome
+    :param chr_arm_cufoff: dict of (chromosome, arm) to (start, end) cut off
+    :return: list of (chromosome, arm, window start, window end)
+    """
+    windows = []
+    for chr_arm in chr_arms:
+        start, end = chr_arm_cufoff.get(chr_arm, (0, 0))
+        if chr_arm[1] == "p":
+            windows.append((chr_arm[0], chr_arm[1], -np.inf, end))
+        elif chr_arm[1] == "q":
+            windows.append((chr_arm[0], chr_arm[1], start, np.inf))
+        else:
+            windows.append((chr_arm[0], chr_arm[1], -np.inf, np.inf))
+    return windows
+
+
+def arm_breakpoints(chr_arm_cufoff):
+    """
+    the cut offs that split the chromosomes into the arm windows, the breakpoints of compact_segments
+    :param chr_arm_cufoff: dict of (chromosome, arm) to (start, end) cut off
+    :return: dict of chromosome to the sorted cut off positions
+    """
+    breakpoints = defaultdict(set)
+    for (chromosome, arm), (start, end) in chr_arm_cufoff.items():
+        if arm == "p":
+            breakpoints[chromosome].add(end)
+        elif arm == "q":
+            breakpoints[chromosome].add(start)
+    return dict((chromosome, sorted(positions)) for chromosome, positions in breakpoints.items())
+
+
+def arm_weights(seg, chr_arms, chr_arm_cufoff):
+    """
+
+    The weight of every segment in every arm window of its sample: the overlap of the segment with the window,
+    scaled by the Length of a compacted segment over its span so the gaps between the merged segments don't count
+
+    :param seg: segment data frame indexed by (Sample, Chromosome)
+    :param chr_arms: list of (chromosome, arm), arm is '' for the whole chromosome
+    :param chr_arm_cufoff: dict of (chromosome, arm) to (start, end) cut off
+    :return: segment rows, (sample, arm) keys (sample code * number of arms + arm), weights, sample names
+    """
+    sample_codes, sample_names = pd.factorize(seg.index.get_level_values(0))
+    chroms = np.asarray(seg.index.get_level_values(1))
+    starts = np.asarray(seg["Start"], dtype=np.float64)
+    ends = np.asarray(seg["End"], dtype=np.float64)
+    lengths = segment_lengths(seg).astype(np.float64)
+    spans = ends - starts
+    with np.errstate(invalid="ignore", divide="ignore"):
+        density = np.where(spans > 0, lengths / spans, 1.0)
+
+    rows, cols, weights = [], [], []
+    for k, (chromosome, arm, lo, hi) in enumerate(arm_windows(chr_arms, chr_arm_cufoff)):
+        idx = np.flatnonzero(chroms == chromosome)
+        if arm == "":
+            w = lengths[idx]
+        else:
+            w = (np.minimum(ends[idx], hi) - np.maximum(starts[idx], lo)) * density[idx]
+        keep = w > 0
+        rows.append(idx[keep])
+        cols.append(np.full(keep.sum(), k))
+        weights.append(w[keep])
+    rows = np.concatenate(rows)
+    key = sample_codes[rows] * len(chr_arms) + np.concatenate(cols)
+    return rows, key, np.concatenate(weights), sample_names
+
+
+def arm_scores(seg, chr_arms, chr_arm_cufoff):
+    """
+
+    Length-weighted segment mean of every sample in every chromosome arm, computed in one grouped pass
+    over the segments (no loop over the samples)
+
+    :param seg: segment data frame indexed by (Sample, Chromosome)
+    :param chr_arms: list of (chromosome, arm), arm is '' for the whole chromosome
+    :param chr_arm_cufoff: dict of (chromosome, arm) to (start, end) cut off
+    :return: data frame of the scores, samples x arms
+    """
+    rows, key, weights, sample_names = arm_weights(seg, chr_arms, chr_arm_cufoff)
+    means = np.asarray(seg["Segment_Mean"], dtype=np.float64)
+    n_samples, n_arms = len(sample_names), len(chr_arms)
+    weight_sum = np.bincount(key, weights=weights, minlength=n_samples * n_arms)
+    score_sum = np.bincount(key, weights=weights * means[rows], minlength=n_samples * n_arms)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = (score_sum / weight_sum).reshape(n_samples, n_arms)
+    return pd.DataFrame(scores, index=pd.Index(sample_names, name="Sample"),
+                        columns=[arm_name(c, a) for c, a in chr_arms])
+
+
+def classify(scores, cond, threshold):
+    """
+    the same grouping as Aneuploidy.chr_CNV: 1 for the samples with the CNV,
+    0 for the samples without CNV in the arm (|score| < threshold), NaN otherwise
+    """
+    if cond == "loss":
+        altered = scores < -threshold
+    else:
+        altered = scores > threshold
+    normal = (scores > -threshold) & (scores < threshold)
+    return np.where(altered, 1.0, np.where(normal, 0.0, np.nan))
+
+
+def event_list(chr_alter_dict, threshold):
+    """
+    the arms to score and the events of chr_alter_dict
+    :return: list of (chromosome, arm), list of (event name, index of its arm, loss/gain, threshold)
+    """
+    chr_arms = sorted(set(chr_arm for arms in chr_alter_dict.values() for chr_arm in arms), key=str)
+    events = []
+    for cond in chr_alter_dict.keys():
+        cond_threshold = threshold[cond] if isinstance(threshold, dict) else threshold
+        for chr_arm in chr_alter_dict[cond]:
+            events.append((event_name(chr_arm[0], chr_arm[1], cond), chr_arms.index(chr_arm), cond, cond_threshold))
+    return chr_arms, events
+
+
+def arm_event_matrix(seg, chr_alter_dict, chr_arm_cufoff, threshold):
+    """
+
+    The sample x arm event matrix of all the CNVs in chr_alter_dict
+
+    :param seg: segment data frame indexed by (Sample, Chromosome)
+    :param chr_alter_dict: dict of loss/gain to the list of (chromosome, arm)
+    :param chr_arm_cufoff: dict of (chromosome, arm) to (start, end) cut off
+    :param threshold: the segment mean threshold, a single value or a dict of loss/gain to value
+    :return: data frame of samples x events (e.g. 8p_loss), 1 altered, 0 normal, NaN neither
+    """
+    chr_arms, event_arms = event_list(chr_alter_dict, threshold)
+    scores = arm_scores(seg, chr_arms, chr_arm_cufoff)
+    events = pd.DataFrame(index=scores.index)
+    for name, k, cond, cond_threshold in event_arms:
+        events[name] = classify(scores.values[:, k], cond, cond_threshold)
+    return events
+
+
+def sample_cohorts(seg, cohort_col="Cohort"):
+    """
+    the cohort of each sample in a pan-cancer segment data frame
+    """
+    samples = seg.index.get_level_values(0)
+    first = ~samples.duplicated()
+    return pd.Series(np.asarray(seg[cohort_col])[first], index=pd.Index(samples[first], name="Sample"))
+
+
+def group_lists(events, cohorts=None):
+    """
+
+    Partition the event matrix into the altered and normal sample lists of each cohort
+
+    :param events: sample x event matrix from arm_event_matrix
+    :param cohorts: Series of sample to cohort, all the samples in one group if None
+    :return: dict of cohort to dict of event to (altered samples, normal samples)
+    """
+    if cohorts is None:
+        cohorts = pd.Series("all", index=events.index)
+    cohorts = cohorts.reindex(events.index)
+    groups = defaultdict(dict)
+    for cohort, sub_events in events.groupby(cohorts.values):
+        for event in sub_events.columns:
+            column = sub_events[event]
+            groups[cohort][event] = (column.index[column == 1].tolist(), column.index[column == 0].tolist())
+    return groups
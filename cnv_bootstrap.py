@@ -0,0 +1,113 @@
+"""
+Bootstrap stability of the CNV grouping: the segment means are perturbed with noise (or the segments resampled)
+many times, all the replicates of a chunk are scored with one sparse matrix product in a process pool
+"""
+
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from concurrent.futures import ProcessPoolExecutor
+from arm_events import arm_weights, event_list, classify
+
+
+_design = None
+_means = None
+_scores = None
+_weight_sum = None
+
+
+def _init_worker(design, means, scores, weight_sum):
+    global _design, _means, _scores, _weight_sum
+    _design = design
+    _means = means
+    _scores = scores
+    _weight_sum = weight_sum
+
+
+def _bootstrap_chunk(args):
+    n_rep, seed, mode, noise_sd, n_samples, event_arms, observed = args
+    rng = np.random.RandomState(seed)
+    n_seg = len(_means)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if mode == "noise":
+            # the weights don't change, only the noise goes through the design
+            scores = _design.dot(rng.normal(0, noise_sd, size=(n_seg, n_rep)))
+            scores /= _weight_sum[:, None]
+            scores += _scores[:, None]
+        else:
+            # Poisson bootstrap of the segments: each segment is drawn Poisson(1) times
+            weights = rng.poisson(1.0, size=(n_seg, n_rep)).astype(np.float64)
+            weight_sum = _design.dot(weights)
+            weights *= _means[:, None]
+            scores = _design.dot(weights) / weight_sum
+    n_arms = scores.shape[0] // n_samples
+    scores = scores.reshape(n_samples, n_arms, n_rep)
+
+    agree = np.zeros((n_samples, len(event_arms)))
+    altered_sizes = np.zeros((n_rep, len(event_arms)))
+    normal_sizes = np.zeros((n_rep, len(event_arms)))
+    for e, (name, k, cond, threshold) in enumerate(event_arms):
+        calls = classify(scores[:, k, :], cond, threshold)
+        same = (calls == observed[:, e][:, None]) | (np.isnan(calls) & np.isnan(observed[:, e])[:, None])
+        agree[:, e] = same.sum(axis=1)
+        altered_sizes[:, e] = (calls == 1).sum(axis=0)
+        normal_sizes[:, e] = (calls == 0).sum(axis=0)
+    return agree, altered_sizes, normal_sizes
+
+
+def bootstrap_groups(seg, chr_alter_dict, chr_arm_cufoff, threshold, n_rep=1000, mode="noise", noise_sd=0.05,
+                     chunk_size=100, processes=None, seed=0):
+    """
+
+    Stability of the altered/normal groups of every arm event over bootstrap replicates
+
+    :param seg: segment data frame indexed by (Sample, Chromosome), normal samples removed
+    :param chr_alter_dict: dict of loss/gain to the list of (chromosome, arm)
+    :param chr_arm_cufoff: dict of (chromosome, arm) to (start, end) cut off
+    :param threshold: the segment mean threshold, a single value or a dict of loss/gain to value
+    :param n_rep: number of replicates
+    :param mode: "noise" adds Gaussian noise (noise_sd) to the segment means, "resample" resamples the segments
+    :param noise_sd: standard deviation of the noise of the segment means
+    :param chunk_size: replicates scored per matrix product
+    :param processes: number of worker processes, all cores if None
+    :param seed: random seed
+    :return: samples x events data frame of the call stability (fraction of the replicates agreeing with the call
+             on the original data), and a data frame of the altered/normal group sizes with 95% intervals per event
+    """
+    chr_arms, event_arms = event_list(chr_alter_dict, threshold)
+    rows, key, weights, sample_names = arm_weights(seg, chr_arms, chr_arm_cufoff)
+    n_samples = len(sample_names)
+    design = sparse.csr_matrix((weights, (key, rows)), shape=(n_samples * len(chr_arms), len(seg)))
+    means = np.asarray(seg["Segment_Mean"], dtype=np.float64)
+
+    weight_sum = np.asarray(design.sum(axis=1)).ravel()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        flat_scores = design.dot(means) / weight_sum
+    scores = flat_scores.reshape(n_samples, len(chr_arms))
+    observed = np.column_stack([classify(scores[:, k], cond, t) for name, k, cond, t in event_arms])
+
+    chunks = [min(chunk_size, n_rep - start) for start in range(0, n_rep, chunk_size)]
+    seeds = np.random.RandomState(seed).randint(0, 2 ** 31 - 1, size=len(chunks))
+    tasks = [(n, s, mode, noise_sd, n_samples, event_arms, observed) for n, s in zip(chunks, seeds)]
+    agree = np.zeros(observed.shape)
+    altered_sizes, normal_sizes = [], []
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(design, means, flat_scores, weight_sum)) as executor:
+        for chunk_agree, chunk_altered, chunk_normal in executor.map(_bootstrap_chunk, tasks):
+            agree += chunk_agree
+            altered_sizes.append(chunk_altered)
+            normal_sizes.append(chunk_normal)
+    altered_sizes = np.vstack(altered_sizes)
+    normal_sizes = np.vstack(normal_sizes)
+
+    names = [e[0] for e in event_arms]
+    stability = pd.DataFrame(agree / n_rep, index=pd.Index(sample_names, name="Sample"), columns=names)
+    group_sizes = pd.DataFrame({"altered": (observed == 1).sum(axis=0),
+                                "altered_2.5%": np.percentile(altered_sizes, 2.5, axis=0),
+                                "altered_97.5%": np.percentile(altered_sizes, 97.5, axis=0),
+                                "normal": (observed == 0).sum(axis=0),
+                                "normal_2.5%": np.percentile(normal_sizes, 2.5, axis=0),
+                                "normal_97.5%": np.percentile(normal_sizes, 97.5, axis=0),
+                                "mean_stability": stability.mean(axis=0).values}, index=names)
+    return stability, group_sizes
@@ -0,0 +1,171 @@
+"""
+Preprocessing of the DNA segment files (Sample, Chromosome, Start, End, Num_Probes, Segment_Mean)
+before the CNV grouping in General_Chr_CNV
+"""
+
+
+import numpy as np
+import pandas as pd
+
+
+def segment_lengths(seg):
+    """
+    lengths of the segments used as weights for the segment means
+    compacted segments carry the summed lengths of the merged segments in the Length column
+    :param seg: segment data frame
+    :return: numpy array of the segment lengths
+    """
+    if "Length" in seg.columns:
+        return np.asarray(seg["Length"])
+    return np.asarray(seg["End"]) - np.asarray(seg["Start"])
+
+
+def compact_segments(seg, tolerance=0.0, verbose=True, breakpoints=None):
+    """
+
+    Merge the consecutive segments of each sample and chromosome whose segment means differ by no more than
+    the tolerance from the first segment of the merged run. The merged segment spans from the first start to the last end, its segment mean is the
+    length-weighted mean of the merged segments, and its Length is the sum of their lengths, so the
+    instability score and the whole chromosome CNV check are unchanged at tolerance 0. With the arm cut offs
+    as breakpoints no merged segment crosses a cut off, and the arm scores are unchanged at tolerance 0 too.
+
+    :param seg: segment data frame indexed by (Sample, Chromosome)
+    :param tolerance: the largest difference of a segment mean from the first mean of the run it is merged into
+    :param verbose: print the compression ratio
+    :param breakpoints: dict of chromosome to the positions a merged segment may not span (arm_events.arm_breakpoints)
+    :return: the compacted segment data frame with the same index names and an extra Length column
+    """
+    index_names = list(seg.index.names)
+    df = seg.reset_index()
+    sample_col, chr_col = df.columns[0], df.columns[1]
+    df = df.sort_values([sample_col, chr_col, "Start"], kind="mergesort")
+    if not len(df):
+        return seg
+
+    lengths = segment_lengths(df).astype(np.float64)
+    means = np.asarray(df["Segment_Mean"], dtype=np.float64)
+    samples = np.asarray(df[sample_col])
+    chroms = np.asarray(df[chr_col])
+
+    # a new run starts at every change of sample/chromosome or jump of the segment mean
+    new_run = np.ones(len(df), dtype=bool)
+    if len(df) > 1:
+        same_group = (samples[1:] == samples[:-1]) & (chroms[1:] == chroms[:-1])
+        new_run[1:] = ~same_group
+        if breakpoints:
+            new_run[1:] |= _spans_breakpoint(chroms, np.asarray(df["Start"]), np.asarray(df["End"]), breakpoints)
+        if tolerance > 0:
+            new_run = _tolerance_runs(means, new_run, tolerance)
+        else:
+            new_run[1:] |= np.diff(means) != 0
+    starts = np.flatnonzero(new_run)
+
+    length_sum = np.add.reduceat(lengths, starts)
+    weighted_sum = np.add.reduceat(lengths * means, starts)
+    mean_sum = np.add.reduceat(means, starts)
+    run_size = np.diff(np.append(starts, len(df)))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        merged_means = np.where(length_sum > 0, weighted_sum / length_sum, mean_sum / run_size)
+
+    compacted = pd.DataFrame({sample_col: samples[starts],
+                              chr_col: chroms[starts],
+                              "Start": np.asarray(df["Start"])[starts],
+                              "End": np.maximum.reduceat(np.asarray(df["End"]), starts)})
+    if "Num_Probes" in df.columns:
+        probes = np.asarray(df["Num_Probes"], dtype=np.float64)
+        compacted["Num_Probes"] = np.add.reduceat(probes, starts)
+        compacted["Num_Probes"] = compacted["Num_Probes"].astype(df["Num_Probes"].dtype)
+    compacted["Segment_Mean"] = merged_means
+    compacted["Length"] = length_sum
+    compacted = compacted.set_index([sample_col, chr_col])
+    compacted.index.names = index_names
+
+    if verbose:
+        ratio = float(len(seg)) / max(len(compacted), 1)
+        print("segments compacted:", len(seg), "->", len(compacted), "compression ratio:", round(ratio, 2))
+    return compacted
+
+
+def _tolerance_runs(means, new_run, tolerance):
+    # compare with the first mean of the current run, neighbouring steps within the tolerance would let a run drift
+    new_run = new_run.copy()
+    first = means[0]
+    for i, (mean, start) in enumerate(zip(means.tolist(), new_run.tolist())):
+        if start or abs(mean - first) > tolerance:
+            new_run[i] = True
+            first = mean
+    return new_run
+
+
+def _spans_breakpoint(chroms, starts, ends, breakpoints):
+    # True between two neighbouring segments when a breakpoint of their chromosome lies inside the pair
+    spans = np.zeros(len(starts) - 1, dtype=bool)
+    for chromosome, positions in breakpoints.items():
+        idx = np.flatnonzero(chroms[1:] == chromosome)
+        if not len(idx):
+            continue
+        positions = np.sort(np.asarray(positions, dtype=np.float64))
+        inside = np.searchsorted(positions, ends[idx + 1], side="left") - \
+            np.searchsorted(positions, starts[idx], side="right")
+        spans[idx] = inside > 0
+    return spans
+
+
+def _categorical(values):
+    # sorted categories keep the sort order of the index the same as the original values
+    uniques = pd.unique(values)
+    try:
+        uniques = sorted(uniques)
+    except TypeError:
+        pass
+    return pd.Categorical(values, categories=uniques)
+
+
+def _downcast_positions(column):
+    # int32 only when all the positions fit, genomic coordinates of hg19 and hg38 do
+    values = np.asarray(column)
+    if len(values) and np.all(np.isfinite(values)) and np.all(values == np.round(values)) and \
+            values.max() < np.iinfo(np.int32).max and values.min() > np.iinfo(np.int32).min:
+        return values.astype(np.int32)
+    return values
+
+
+def normalize_segments(seg):
+    """
+
+    Normalize the segment data frame once at load: categorical (Sample, Chromosome) index, int32 positions
+    where safe, float64 segment means, a precomputed Length column, sorted by the index and the segment starts
+
+    :param seg: segment data frame indexed by (Sample, Chromosome)
+    :return: the normalized segment data frame
+    """
+    index_names = list(seg.index.names)
+    df = seg.reset_index()
+    sample_col, chr_col = df.columns[0], df.columns[1]
+    if "Length" not in df.columns:
+        df["Length"] = segment_lengths(df)
+    for col in ["Start", "End", "Num_Probes", "Length"]:
+        if col in df.columns:
+            df[col] = _downcast_positions(df[col])
+    # float64: float32 moves the means lying on the thresholds (float32(-0.2) < -0.2) into the altered group
+    df["Segment_Mean"] = df["Segment_Mean"].astype(np.float64)
+    df[sample_col] = _categorical(df[sample_col])
+    df[chr_col] = _categorical(df[chr_col])
+    df = df.sort_values([sample_col, chr_col, "Start"], kind="mergesort")
+    df = df.set_index([sample_col, chr_col])
+    df.index.names = index_names
+    return df
+
+
+def is_sorted(seg):
+    """
+    check the order of the rows themselves (a flag in attrs survives the reordering of the rows)
+    :param seg: segment data frame
+    :return: True if the segment data frame is sorted by its index and the starts within each sample and chromosome
+    """
+    if not seg.index.is_monotonic_increasing:
+        return False
+    if "Start" not in seg.columns or len(seg) < 2:
+        return True
+    same_group = np.diff(pd.factorize(seg.index)[0]) == 0
+    return bool(np.all(np.diff(np.asarray(seg["Start"], dtype=np.float64))[same_group] >= 0))
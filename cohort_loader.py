@@ -0,0 +1,109 @@
+"""
+Load the segment and RNA files of the cohorts one after another,
+prefetching the next cohort on a background thread while the current one is processed
+"""
+
+
+import pandas as pd
+from os import listdir
+from os.path import isdir, join
+from concurrent.futures import ThreadPoolExecutor
+from cnv_segments import compact_segments, normalize_segments
+from arm_events import sample_cohorts
+
+
+class Cohort:
+
+    """
+    The segment and RNA data of one cohort, released once the next cohort is requested
+    """
+
+    def __init__(self, name, seg, rna):
+        self.name = name
+        self.seg = seg
+        self.rna = rna
+
+    def release(self):
+        self.seg = None
+        self.rna = None
+
+
+def read_segments(seg_file, compact_tol=0.0, breakpoints=None):
+    """
+    read in the segment file, compact and normalize it
+    :param seg_file: the segment file of the cohort
+    :param compact_tol: the tolerance of compact_segments
+    :param breakpoints: the arm cut offs no merged segment may span (arm_events.arm_breakpoints)
+    :return: the segment data frame indexed by (Sample, Chromosome)
+    """
+    seg = pd.read_table(seg_file, index_col=[0, 1])
+    return normalize_segments(compact_segments(seg, tolerance=compact_tol, breakpoints=breakpoints))
+
+
+def read_rna(rna_file):
+    return pd.read_table(rna_file, index_col=0)
+
+
+def read_pan_cancer_segments(path, cohort_col="Cohort", compact_tol=0.0, breakpoints=None):
+    """
+
+    Read the segment data of all the cohorts into one data frame for the pan-cancer mode
+
+    :param path: a concatenated segment file with a cohort column, or a directory of segment files (*.seg.txt)
+                 whose cohort is the file name prefix before the first "_", e.g. BRCA__CNV.seg.txt
+    :param cohort_col: the name of the cohort column
+    :param compact_tol: the tolerance of compact_segments
+    :param breakpoints: the arm cut offs no merged segment may span (arm_events.arm_breakpoints)
+    :return: the normalized segment data frame indexed by (Sample, Chromosome) with the cohort column
+    """
+    if isdir(path):
+        seg_files = sorted(f for f in listdir(path) if f.endswith(".seg.txt"))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            segs = list(executor.map(lambda f: pd.read_table(f, index_col=[0, 1]),
+                                     [join(path, f) for f in seg_files]))
+        for f, seg in zip(seg_files, segs):
+            seg[cohort_col] = f.split("_")[0]
+        seg = pd.concat(segs)
+    else:
+        seg = pd.read_table(path, index_col=[0, 1])
+        if cohort_col not in seg.columns:
+            raise ValueError("No cohort column " + cohort_col + " in " + path)
+    # the compaction only keeps the segment columns, put the cohort of each sample back afterwards
+    cohorts = sample_cohorts(seg, cohort_col)
+    seg = normalize_segments(compact_segments(seg.drop(cohort_col, axis=1), tolerance=compact_tol,
+                                              breakpoints=breakpoints))
+    seg[cohort_col] = pd.Categorical(cohorts.reindex(seg.index.get_level_values(0)).values)
+    print("pan-cancer segments:", len(seg), "cohorts:", ", ".join(sorted(cohorts.unique())))
+    return seg
+
+
+def _submit(executor, cohort, compact_tol, breakpoints):
+    name, seg_file, rna_file = cohort
+    return executor.submit(read_segments, seg_file, compact_tol, breakpoints), executor.submit(read_rna, rna_file)
+
+
+def prefetch_cohorts(cohorts, compact_tol=0.0, breakpoints=None):
+    """
+
+    Iterate over the cohorts, the files of the next cohort are read in the background while the
+    current cohort is processed. The previous cohort is released when the loop moves on,
+    so at most two cohorts are held in memory as long as the caller keeps no other reference to them.
+
+    :param cohorts: list of (name, segment file, RNA file)
+    :param compact_tol: the tolerance of compact_segments
+    :param breakpoints: the arm cut offs no merged segment may span (arm_events.arm_breakpoints)
+    :return: generator of Cohort
+    """
+    cohorts = list(cohorts)
+    if not cohorts:
+        return
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pending = _submit(executor, cohorts[0], compact_tol, breakpoints)
+        for k in range(len(cohorts)):
+            cohort = Cohort(cohorts[k][0], pending[0].result(), pending[1].result())
+            pending = None
+            if k + 1 < len(cohorts):
+                pending = _submit(executor, cohorts[k + 1], compact_tol, breakpoints)
+            print(cohort.name, "loaded.")
+            yield cohort
+            cohort.release()
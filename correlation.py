@@ -0,0 +1,97 @@
+"""
+Pearson/Spearman correlation matrix with p-values from one standardized matrix product,
+NaN-aware (pairwise complete observations) with FDR correction
+"""
+
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from stat_utils import p_adjust_bh
+
+
+def rank_columns(values):
+    """
+    average ranks of each column, NaN stay NaN
+    """
+    return pd.DataFrame(values).rank(axis=0).values
+
+
+def _pairwise_correlation(values):
+    present = ~np.isnan(values)
+    if present.all():
+        n = values.shape[0]
+        z = (values - values.mean(axis=0)) / values.std(axis=0, ddof=1)
+        return z.T.dot(z) / (n - 1), np.full((values.shape[1], values.shape[1]), float(n))
+    mask = present.astype(np.float64)
+    x = np.where(present, values, 0.0)
+    n = mask.T.dot(mask)
+    sum_x = x.T.dot(mask)
+    sum_xx = (x ** 2).T.dot(mask)
+    sum_xy = x.T.dot(x)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = n * sum_xy - sum_x * sum_x.T
+        var = (n * sum_xx - sum_x ** 2) * (n * sum_xx - sum_x ** 2).T
+        return cov / np.sqrt(var), n
+
+
+def _pairwise_spearman(values, corr):
+    # the columns with NaN are ranked again on the complete observations of each pair, as DataFrame.corr
+    present = ~np.isnan(values)
+    for i in np.flatnonzero(~present.all(axis=0)):
+        for j in range(values.shape[1]):
+            if j == i:
+                continue
+            both = present[:, i] & present[:, j]
+            if both.sum() < 2:
+                corr[i, j] = corr[j, i] = np.nan
+                continue
+            ranks = rank_columns(values[both][:, [i, j]])
+            with np.errstate(invalid="ignore", divide="ignore"):
+                corr[i, j] = corr[j, i] = np.corrcoef(ranks[:, 0], ranks[:, 1])[0, 1]
+    return corr
+
+
+def correlation_matrix(df, method="pearson"):
+    """
+
+    Correlation of all pairs of columns with their p-values
+
+    :param df: data frame, observations x features
+    :param method: pearson or spearman (ranks within each column, within the complete pairs of the columns with NaN)
+    :return: correlation, p-value and number of observations data frames, features x features
+    """
+    values = np.asarray(df, dtype=np.float64)
+    if method == "spearman":
+        corr, n = _pairwise_correlation(rank_columns(values))
+        if np.isnan(values).any():
+            corr = _pairwise_spearman(values, corr)
+    else:
+        corr, n = _pairwise_correlation(values)
+    corr = np.clip(corr, -1.0, 1.0)
+    dof = n - 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = corr * np.sqrt(dof / (1.0 - corr ** 2))
+        p = 2 * stats.t.sf(np.abs(t), dof)
+    p[np.abs(corr) == 1.0] = 0.0
+    p[dof <= 0] = np.nan
+    np.fill_diagonal(p, 0.0)
+    columns = df.columns
+    return (pd.DataFrame(corr, index=columns, columns=columns),
+            pd.DataFrame(p, index=columns, columns=columns),
+            pd.DataFrame(n, index=columns, columns=columns))
+
+
+def correlation_table(df, method="pearson"):
+    """
+    long table of the correlation of each pair of columns (upper triangle) with the BH adjusted p-values
+    :param df: data frame, observations x features
+    :param method: pearson or spearman
+    :return: data frame with feature_1, feature_2, corr, p_value, padj, n
+    """
+    corr, p, n = correlation_matrix(df, method)
+    i, j = np.triu_indices(len(corr.columns), k=1)
+    table = pd.DataFrame({"feature_1": corr.columns[i], "feature_2": corr.columns[j],
+                          "corr": corr.values[i, j], "p_value": p.values[i, j], "n": n.values[i, j]})
+    table["padj"] = p_adjust_bh(table["p_value"].values)
+    return table
@@ -0,0 +1,271 @@
+"""
+Differential expression of the altered vs normal samples of all the CNV arms in one pass
+limma-voom style linear model on log-CPM, replacing the DESeq2 run per arm in r_file.R
+"""
+
+
+import os
+import numpy as np
+import pandas as pd
+from os.path import basename, dirname, join
+from scipy import special, stats
+from scipy.sparse import coo_matrix
+from concurrent.futures import ThreadPoolExecutor
+from stat_utils import p_adjust_bh
+from normalization import normalize_counts, size_factors
+
+
+def short_barcode(sample):
+    return "-".join(sample.split("-")[0:4])
+
+
+def align_samples(counts, events):
+    """
+    match the RNA samples with the samples of the event matrix by their first four barcode fields,
+    the same way as Aneuploidy.set_samples_altered, the first of the duplicated samples is kept
+    :param counts: RNA counts, genes x samples
+    :param events: sample x event matrix from arm_events.arm_event_matrix
+    :return: counts and events with the same samples in the same order
+    """
+    counts = counts.loc[~counts.index.duplicated(keep="last")]
+    counts.columns = [short_barcode(x) for x in counts.columns]
+    counts = counts.loc[:, ~counts.columns.duplicated()]
+    events = events.copy()
+    events.index = [short_barcode(x) for x in events.index]
+    events = events.loc[~events.index.duplicated()]
+    samples = counts.columns.intersection(events.index)
+    return counts[samples], events.loc[samples]
+
+
+def log_cpm(counts, factors=None):
+    """
+    log-CPM on the effective library sizes, the size factors scaled to the geometric mean library size
+    so a few highly expressed genes don't shift all the other genes (raw library sizes if None)
+    :param counts: raw counts, genes x samples
+    :param factors: median-of-ratios size factors of the samples
+    :return: log-CPM, effective library sizes
+    """
+    lib_size = counts.sum(axis=0)
+    if factors is not None:
+        lib_size = np.asarray(factors, dtype=np.float64) * np.exp(np.log(lib_size).mean())
+    return np.log2((counts + 0.5) / (lib_size + 1.0) * 1e6), lib_size
+
+
+def voom_weights(logcpm, lib_size, bins=50):
+    """
+    precision weights of the observations from the mean-variance trend of the genes,
+    the trend is fitted once for all the arms (binned instead of lowess)
+    :param logcpm: log-CPM, genes x samples
+    :param lib_size: library sizes of the samples
+    :param bins: number of bins of the trend
+    :return: weights, genes x samples
+    """
+    log_lib = np.log2(lib_size + 1.0) - np.log2(1e6)
+    gene_mean = logcpm.mean(axis=1)
+    sx = gene_mean + log_lib.mean()
+    sy = np.sqrt(logcpm.std(axis=1, ddof=1))
+    order = np.argsort(sx)
+    chunks = np.array_split(order, min(bins, len(order)))
+    trend_x = np.array([sx[c].mean() for c in chunks])
+    trend_y = np.array([np.median(sy[c]) for c in chunks])
+    fitted_count = gene_mean[:, None] + log_lib[None, :]
+    fitted_sd = np.interp(fitted_count, trend_x, trend_y)
+    return 1.0 / np.maximum(fitted_sd, 1e-4) ** 4
+
+
+def trigamma_inverse(y):
+    y = np.asarray(y, dtype=np.float64)
+    x = np.where(y > 1e7, 1.0 / np.sqrt(y), np.where(y < 1e-6, 1.0 / y, 0.5 + 1.0 / y))
+    newton = (y <= 1e7) & (y >= 1e-6)
+    for i in range(50):
+        tri = special.polygamma(1, x)
+        dif = np.where(newton, tri * (1 - tri / y) / special.polygamma(2, x), 0.0)
+        x = x + dif
+        if np.all(-dif / x < 1e-8):
+            break
+    return x
+
+
+def squeeze_var(var, df):
+    """
+    empirical Bayes moderation of the gene variances (limma fitFDist/squeezeVar), one prior per column
+    :param var: residual variances, genes x contrasts
+    :param df: residual degrees of freedom of each contrast
+    :return: posterior variances and prior degrees of freedom of each contrast
+    """
+    var = np.maximum(var, 1e-12)
+    half_df = np.asarray(df, dtype=np.float64) / 2
+    e = np.log(var) - special.digamma(half_df) + np.log(half_df)
+    e_mean = e.mean(axis=0)
+    e_var = e.var(axis=0, ddof=1) - special.polygamma(1, half_df)
+    df_prior = np.where(e_var > 0, 2 * trigamma_inverse(np.where(e_var > 0, e_var, 1.0)), np.inf)
+    with np.errstate(invalid="ignore"):
+        var_prior = np.where(np.isfinite(df_prior),
+                             np.exp(e_mean + special.digamma(df_prior / 2) - np.log(df_prior / 2)),
+                             np.exp(e_mean))
+        var_post = np.where(np.isfinite(df_prior), (df_prior * var_prior + df * var) / (df_prior + df), var_prior)
+    return var_post, df_prior
+
+
+def fit_arms(logcpm, weights, events):
+    """
+
+    Weighted two-group linear model of every arm, computed for all the arms with matrix products
+    of the expression against the altered (1) and normal (0) indicator matrices
+
+    :param logcpm: log-CPM, genes x samples
+    :param weights: precision weights, genes x samples
+    :param events: samples x arms, 1 altered, 0 normal, NaN left out
+    :return: dict of genes x arms arrays: logFC, se, t, pvalue, padj
+    """
+    events = np.asarray(events, dtype=np.float64)
+    altered = (events == 1).astype(np.float64)
+    normal = (events == 0).astype(np.float64)
+    wy = weights * logcpm
+    wyy = wy * logcpm
+    sums = {}
+    for group, design in [("altered", altered), ("normal", normal)]:
+        sums[group] = (weights.dot(design), wy.dot(design), wyy.dot(design))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        w_a, wy_a, wyy_a = sums["altered"]
+        w_n, wy_n, wyy_n = sums["normal"]
+        mean_a = wy_a / w_a
+        mean_n = wy_n / w_n
+        rss = (wyy_a - wy_a * mean_a) + (wyy_n - wy_n * mean_n)
+        df = altered.sum(axis=0) + normal.sum(axis=0) - 2
+        var = rss / df
+        var_post, df_prior = squeeze_var(np.where(df > 0, var, 1.0), np.maximum(df, 1))
+        log_fc = mean_a - mean_n
+        se = np.sqrt(var_post * (1.0 / w_a + 1.0 / w_n))
+        t = log_fc / se
+        p = 2 * stats.t.sf(np.abs(t), np.minimum(df + df_prior, 1e6))
+    p[:, df <= 0] = np.nan
+    return {"logFC": log_fc, "se": se, "t": t, "pvalue": p, "padj": p_adjust_bh(p, axis=0)}
+
+
+def batch_dge(counts, events, min_count=1):
+    """
+
+    Differential expression (YES vs NO) of all the arms of the event matrix
+
+    :param counts: raw RNA counts, genes x samples
+    :param events: sample x event matrix from arm_events.arm_event_matrix
+    :param min_count: keep the genes with more counts than this in total, as in r_file.R
+    :return: dict of event to its result table in the DESeq2 results layout
+    """
+    counts, events = align_samples(counts, events)
+    counts = counts.loc[counts.sum(axis=1) > min_count].astype(np.float64)
+    print("DGE samples:", counts.shape[1], "genes:", counts.shape[0], "arms:", events.shape[1])
+    factors = size_factors(counts)
+    logcpm, lib_size = log_cpm(counts.values, factors.values)
+    weights = voom_weights(logcpm, lib_size)
+    fit = fit_arms(logcpm, weights, events.values)
+    normalized = normalize_counts(counts, factors).values
+
+    tables = {}
+    for k, event in enumerate(events.columns):
+        used = events[event].notnull().values
+        res = pd.DataFrame({"baseMean": normalized[:, used].mean(axis=1),
+                            "log2FoldChange": fit["logFC"][:, k],
+                            "lfcSE": fit["se"][:, k],
+                            "stat": fit["t"][:, k],
+                            "pvalue": fit["pvalue"][:, k],
+                            "padj": fit["padj"][:, k]}, index=counts.index)
+        tables[event] = res.dropna().sort_values(by="padj")
+    return tables
+
+
+def write_dge_tables(tables, wd, cancer):
+    """
+    write the result table of each arm as <wd>/<cancer>_DGE/<arm>_res_YESvsNO_<cancer>.txt,
+    the layout read by Rank_rank_prep.genes_overlaps_DGE
+    """
+    out_dir = join(wd, cancer + "_DGE")
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    for event, res in tables.items():
+        res.to_csv(join(out_dir, event.replace("_", "") + "_res_YESvsNO_" + cancer + ".txt"), sep="\t")
+    print(cancer, len(tables), "DGE tables written.")
+
+
+def find_dge_tables(wd):
+    """
+    the <cancer>_DGE/<arm>_res_YESvsNO_<cancer>.txt tables under wd
+    :return: list of (signature, path), the signature is <cancer><arm> as in genes_overlaps_DGE
+    """
+    tables = []
+    for d in sorted(os.listdir(wd)):
+        path = join(wd, d)
+        if not os.path.isdir(path):
+            continue
+        cancer = d.split("_")[0]
+        for f in sorted(os.listdir(path)):
+            if "_res_YESvsNO_" in f and f.endswith(".txt"):
+                tables.append((cancer + f.split("_")[0], join(path, f)))
+    return tables
+
+
+def gsea_signature(path):
+    """
+    <cancer>_<arm>_<condition> of a DGE table, e.g. BRCA0.2_8p_loss, the run name fields of gsea.write_reports
+    :param path: a table path from find_dge_tables
+    :return: the signature
+    """
+    cancer = basename(dirname(path)).split("_")[0]
+    event = basename(path).split("_")[0]
+    for cond in ("loss", "gain"):
+        if event.endswith(cond):
+            return "_".join([cancer, event[:-len(cond)], cond])
+    return cancer + "_" + event
+
+
+def _read_significant(path, padj):
+    df = pd.read_table(path, index_col=0)
+    # a gene listed twice keeps its last row, the sparse assembly would add the two values
+    df = df[~df.index.duplicated(keep="last")]
+    df = df[df["padj"] < padj]
+    return df["log2FoldChange"]
+
+
+def read_dge_tables(wd, padj=0.05, sparse=True, processes=None):
+    """
+
+    The genes x signatures log2FoldChange matrix of all the DGE tables under wd, the genes with padj below
+    the cut off are kept at parse time. The tables are read in a thread pool and assembled once from the
+    long (gene, signature, log2FoldChange) arrays
+
+    :param wd: directory of the <cancer>_DGE directories
+    :param padj: adjusted p-value cut off
+    :param sparse: sparse columns (fill value NaN) since most genes are not significant in a signature,
+    a dense data frame otherwise
+    :param processes: number of worker threads
+    :return: data frame, genes x signatures
+    """
+    tables = find_dge_tables(wd)
+    with ThreadPoolExecutor(max_workers=processes) as pool:
+        jobs = [pool.submit(_read_significant, path, padj) for signature, path in tables]
+        fold_changes = [job.result() for job in jobs]
+
+    signatures = [signature for signature, path in tables]
+    sizes = [len(lfc) for lfc in fold_changes]
+    col = np.repeat(np.arange(len(tables)), sizes)
+    values = np.concatenate([lfc.values for lfc in fold_changes]) if tables else np.zeros(0)
+    genes = np.concatenate([lfc.index.values for lfc in fold_changes]) if tables else np.zeros(0, dtype=object)
+    row, gene_names = pd.factorize(genes, sort=True)
+    print(len(tables), "DGE tables,", len(gene_names), "significant genes,", len(values), "entries")
+
+    if sparse:
+        # one column at a time through a reused buffer, only the significant entries are stored
+        matrix = coo_matrix((values, (row, col)), shape=(len(gene_names), len(signatures))).tocsc()
+        buffer = np.empty(len(gene_names))
+        columns = {}
+        for j, signature in enumerate(signatures):
+            start, end = matrix.indptr[j], matrix.indptr[j + 1]
+            buffer.fill(np.nan)
+            buffer[matrix.indices[start:end]] = matrix.data[start:end]
+            columns[signature] = pd.arrays.SparseArray(buffer, fill_value=np.nan)
+        return pd.DataFrame(columns, index=gene_names, columns=signatures)
+    dense = np.full((len(gene_names), len(signatures)), np.nan)
+    dense[row, col] = values
+    return pd.DataFrame(dense, index=gene_names, columns=signatures)
@@ -0,0 +1,68 @@
+"""
+Registry of the gene lists (e.g. keratin and immune genes) removed from the RNA data,
+each list is read from disk once per process
+"""
+
+
+import pandas as pd
+from gene_sets import read_gmt
+
+
+# name -> (file, read options)
+GENE_LISTS = {
+    "keratin_immune": ("/home/rshen/genomic_instability/keratin_immune_etc.xlsx", {"sheet_name": "Table S4", "column": "Gene"}),
+}
+
+_gene_list_cache = {}
+
+
+def register_gene_list(name, path, **options):
+    """
+    register a gene list file under a name
+    :param name: the name of the gene list
+    :param path: Excel (.xlsx/.xls), GMT (.gmt) or text file (one gene per line)
+    :param options: sheet_name and column for Excel files, gene_sets to pick from a GMT file
+    """
+    GENE_LISTS[name] = (path, options)
+    _gene_list_cache.pop(name, None)
+
+
+def _read_gene_list(path, options):
+    if path.endswith(".xlsx") or path.endswith(".xls"):
+        genes = pd.read_excel(path, sheet_name=options.get("sheet_name", 0))[options.get("column", "Gene")]
+        genes = genes.dropna().astype(str).str.strip().tolist()
+    elif path.endswith(".gmt"):
+        collection = read_gmt(path)
+        gene_sets = options.get("gene_sets", collection.names)
+        genes = [g for name in gene_sets if name in collection for g in collection[name]]
+    else:
+        with open(path) as f:
+            genes = [line.strip() for line in f if line.strip()]
+    return pd.Index(genes).unique()
+
+
+def load_gene_list(name):
+    """
+    the genes of a registered gene list, read in on the first call and cached afterwards
+    :param name: the name of the gene list, or the path of a gene list file
+    :return: pandas Index of the genes
+    """
+    if name not in _gene_list_cache:
+        path, options = GENE_LISTS.get(name, (name, {}))
+        _gene_list_cache[name] = _read_gene_list(path, options)
+    return _gene_list_cache[name]
+
+
+def remove_genes(rna, names):
+    """
+    remove the genes of one or more gene lists from the RNA data with a single boolean mask
+    :param rna: RNA data frame, genes x samples
+    :param names: the name (or a list of names) of the gene lists
+    :return: the RNA data frame without the genes
+    """
+    if isinstance(names, str):
+        names = [names]
+    genes = pd.Index([])
+    for name in names:
+        genes = genes.union(load_gene_list(name))
+    return rna.loc[~rna.index.isin(genes)]
@@ -0,0 +1,159 @@
+"""
+Gene sets as a sparse incidence matrix (gene sets x genes) aligned to a gene index,
+the scores of all the gene sets on all the signatures come from one sparse product
+"""
+
+
+import os
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+
+class GeneSetCollection(object):
+    """
+    gene sets of a GMT file as integer codes into a gene vocabulary with CSR offsets,
+    the genes of set i are vocabulary[indices[indptr[i]:indptr[i + 1]]]
+    """
+
+    def __init__(self, names, descriptions, vocabulary, indptr, indices):
+        self.names = np.asarray(names, dtype=str).tolist()
+        self.descriptions = np.asarray(descriptions, dtype=str).tolist()
+        self.vocabulary = np.asarray(vocabulary)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self._positions = dict((name, i) for i, name in enumerate(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def __getitem__(self, name):
+        i = self._positions[name]
+        return self.vocabulary[self.indices[self.indptr[i]:self.indptr[i + 1]]].tolist()
+
+    def keys(self):
+        return list(self.names)
+
+    def items(self):
+        return [(name, self[name]) for name in self.names]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    @property
+    def sizes(self):
+        return pd.Series(np.diff(self.indptr), index=self.names)
+
+    def incidence(self, genes=None):
+        """
+        CSR incidence gene sets x genes, on the vocabulary or aligned to a gene index
+        :param genes: the gene index, genes of the sets missing from it are left out
+        :return: csr matrix with 1 for membership
+        """
+        rows = np.repeat(np.arange(len(self.names)), np.diff(self.indptr))
+        if genes is None:
+            cols, n_genes = self.indices, len(self.vocabulary)
+        else:
+            cols, n_genes = pd.Index(genes).get_indexer(self.vocabulary)[self.indices], len(genes)
+        found = cols >= 0
+        incidence = csr_matrix((np.ones(found.sum()), (rows[found], cols[found])), shape=(len(self.names), n_genes))
+        incidence.sum_duplicates()
+        incidence.data[:] = 1.0
+        return incidence
+
+
+def _parse_gmt(path):
+    names, descriptions, indices, indptr = [], [], [], [0]
+    vocabulary = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.rstrip("\r\n").split("\t")
+            if len(fields) < 2:
+                continue
+            names.append(fields[0])
+            descriptions.append(fields[1])
+            indices.extend([vocabulary.setdefault(g, len(vocabulary)) for g in fields[2:] if g])
+            indptr.append(len(indices))
+    vocabulary = sorted(vocabulary, key=vocabulary.get)
+    return GeneSetCollection(names, descriptions, vocabulary, indptr, indices)
+
+
+def read_gmt(path, cache=True):
+    """
+
+    Read a GMT file (name, description, genes... per line) into a GeneSetCollection, streamed line by line.
+    The collection is cached next to the file as <path>.npz and read back while the file is unchanged
+
+    :param path: the GMT file
+    :param cache: read and write the binary cache
+    :return: GeneSetCollection, usable as a dict of gene set name to its genes
+    """
+    cache_file = path + ".npz"
+    stamp = np.array([os.path.getmtime(path), os.path.getsize(path)])
+    if cache and os.path.exists(cache_file):
+        with np.load(cache_file) as data:
+            if np.array_equal(data["stamp"], stamp):
+                return GeneSetCollection(data["names"], data["descriptions"], data["vocabulary"],
+                                         data["indptr"], data["indices"])
+    collection = _parse_gmt(path)
+    print(len(collection), "gene sets,", len(collection.vocabulary), "genes read from", path)
+    if cache:
+        np.savez(cache_file, stamp=stamp, names=np.asarray(collection.names, dtype=str),
+                 descriptions=np.asarray(collection.descriptions, dtype=str),
+                 vocabulary=np.asarray(collection.vocabulary, dtype=str),
+                 indptr=collection.indptr, indices=collection.indices)
+    return collection
+
+
+def incidence_matrix(gene_sets, genes):
+    """
+    CSR incidence of the gene sets on the genes, the genes of a set missing from the index are left out
+    :param gene_sets: dict of gene set name to its list of genes, or a GeneSetCollection
+    :param genes: the gene index the matrix is aligned to (e.g. the DGE index)
+    :return: (csr matrix gene sets x genes with 1 for membership, list of the gene set names)
+    """
+    if isinstance(gene_sets, GeneSetCollection):
+        return gene_sets.incidence(genes), gene_sets.names
+    genes = pd.Index(genes)
+    names = list(gene_sets.keys())
+    members = [list(gene_sets[name]) for name in names]
+    sizes = np.array([len(m) for m in members], dtype=np.int64)
+    cols = genes.get_indexer(pd.Index([g for m in members for g in m], dtype=object))
+    rows = np.repeat(np.arange(len(names)), sizes)
+    found = cols >= 0
+    incidence = csr_matrix((np.ones(found.sum()), (rows[found], cols[found])), shape=(len(names), len(genes)))
+    # a gene listed twice in a set counts once
+    incidence.sum_duplicates()
+    incidence.data[:] = 1.0
+    return incidence, names
+
+
+SCORES = ["sum", "mean", "normalized"]
+
+
+def score_gene_sets(gene_sets, values, score="sum"):
+    """
+
+    Scores of every gene set on every signature from one sparse-dense product of the incidence matrix
+    with the genes x signatures values, NaN values count as 0
+
+    :param gene_sets: dict of gene set name to its list of genes, or a GeneSetCollection
+    :param values: genes x signatures data frame (e.g. log2FoldChange)
+    :param score: sum of the values of the set genes, their mean, or the sum over the square root of the size
+    :return: gene sets x signatures data frame
+    """
+    if score not in SCORES:
+        raise ValueError("score should be one of " + ", ".join(SCORES))
+    incidence, names = incidence_matrix(gene_sets, values.index)
+    scores = np.asarray(incidence.dot(np.nan_to_num(np.asarray(values, dtype=np.float64))))
+    if score != "sum":
+        size = np.asarray(incidence.sum(axis=1), dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scores = scores / (size if score == "mean" else np.sqrt(size))
+    return pd.DataFrame(scores, index=names, columns=values.columns)
@@ -0,0 +1,225 @@
+"""
+Preranked gene set enrichment (GSEA) of all the gene sets on many ranked lists at once,
+the running sums of all the sets are computed together on the sparse incidence and the
+gene set permutation nulls are batched in a process pool
+"""
+
+
+import os
+import numpy as np
+import pandas as pd
+from os.path import join
+from concurrent.futures import ProcessPoolExecutor
+from gene_sets import incidence_matrix
+
+
+_incidence = None
+_scores = None
+_starts = None
+_sizes = None
+
+
+def _init_worker(incidence, scores, starts, sizes):
+    global _incidence, _scores, _starts, _sizes
+    _incidence = incidence
+    _scores = scores
+    _starts = starts
+    _sizes = sizes
+
+
+def _miss_fraction(positions, starts, sizes, n):
+    # fraction of the misses of each set before each of its hits, the same for every weighting
+    within = np.arange(positions.shape[1]) - np.repeat(starts, sizes)
+    return (positions - within) / np.repeat(n - sizes, sizes).astype(np.float64)
+
+
+def _running_sum(positions, weights, starts, sizes, n, miss=None):
+    # running sum at the hits of every set, positions are sorted within each set (rows are replicates)
+    if miss is None:
+        miss = _miss_fraction(positions, starts, sizes, n)
+    cum = np.cumsum(weights, axis=1)
+    end = cum[:, starts + sizes - 1]
+    before = np.zeros(end.shape)
+    before[:, 1:] = end[:, :-1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = 1.0 / (end - before)
+    cum -= np.repeat(before, sizes, axis=1)
+    cum *= np.repeat(scale, sizes, axis=1)
+    up = cum - miss
+    down = up - weights * np.repeat(scale, sizes, axis=1)
+    return up, down
+
+
+def enrichment_scores(positions, weights, starts, sizes, n, miss=None):
+    """
+    enrichment scores (the largest deviation of the running sum from 0) of all the sets
+    :param positions: replicates x hits array of the rank positions of the set genes, sorted within each set
+    :param weights: replicates x hits array of the weights of the set genes (|score| ** p)
+    :param starts: the offset of each set in the hits
+    :param sizes: the number of genes of each set
+    :param n: the number of ranked genes
+    :param miss: the miss fractions of the positions if already computed
+    :return: replicates x sets array of the scores
+    """
+    up, down = _running_sum(positions, weights, starts, sizes, n, miss)
+    top = np.maximum.reduceat(up, starts, axis=1)
+    bottom = np.minimum.reduceat(down, starts, axis=1)
+    return np.where(top >= -bottom, top, bottom)
+
+
+def _weights(scores, positions, weight):
+    weights = np.abs(scores[positions])
+    return weights if weight == 1 else weights ** weight
+
+
+def _null_chunk(args):
+    n_perm, seed, weight = args
+    rng = np.random.RandomState(seed)
+    n = _scores.shape[1]
+    batch = max(1, int(2e6 // max(_incidence.nnz, 1)))
+    null = []
+    for start in range(0, n_perm, batch):
+        # a random permutation of the genes gives every set a random set of the same size, the same
+        # random sets serve all the ranked lists; the column permuted CSC converts to CSR with sorted hits
+        positions = np.vstack([_incidence[:, rng.permutation(n)].tocsr().indices
+                               for _ in range(min(batch, n_perm - start))])
+        miss = _miss_fraction(positions, _starts, _sizes, n)
+        null.append(np.stack([enrichment_scores(positions, _weights(scores, positions, weight), _starts, _sizes, n,
+                                                miss) for scores in _scores]))
+    return np.concatenate(null, axis=1)
+
+
+def _normalize(es, null):
+    # scores divided by the mean of the null scores of the same sign, per set
+    pos_mean = np.nanmean(np.where(null >= 0, null, np.nan), axis=0)
+    neg_mean = -np.nanmean(np.where(null < 0, null, np.nan), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        nes = np.where(es >= 0, es / pos_mean, es / neg_mean)
+        null_nes = np.where(null >= 0, null / pos_mean, null / neg_mean)
+    return nes, null_nes
+
+
+def _tail_fraction(values, reference, upper):
+    # fraction of the reference at or beyond each value, on the positive (upper) or negative side
+    reference = np.sort(reference[~np.isnan(reference)])
+    if not len(reference):
+        return np.full(values.shape, np.nan)
+    if upper:
+        return (len(reference) - np.searchsorted(reference, values, side="left")) / float(len(reference))
+    return np.searchsorted(reference, values, side="right") / float(len(reference))
+
+
+def _statistics(es, null):
+    nes, null_nes = _normalize(es, null)
+    n_perm = null.shape[0]
+    pos, neg = es >= 0, es < 0
+    nominal = np.where(pos, ((null >= es) & (null >= 0)).sum(axis=0) / np.maximum((null >= 0).sum(axis=0), 1),
+                       ((null <= es) & (null < 0)).sum(axis=0) / np.maximum((null < 0).sum(axis=0), 1))
+    fdr = np.full(es.shape, np.nan)
+    fwer = np.full(es.shape, np.nan)
+    for side, mask in [(True, pos), (False, neg)]:
+        if not mask.any():
+            continue
+        null_side = null_nes[null_nes >= 0] if side else null_nes[null_nes < 0]
+        obs_side = nes[pos] if side else nes[neg]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fdr[mask] = np.minimum(_tail_fraction(nes[mask], null_side, side) /
+                                   _tail_fraction(nes[mask], obs_side, side), 1.0)
+        extreme = np.nanmax(np.where(null_nes >= 0, null_nes, np.nan), axis=1) if side else \
+            np.nanmin(np.where(null_nes < 0, null_nes, np.nan), axis=1)
+        fwer[mask] = _tail_fraction(nes[mask], extreme, side)
+    return nes, nominal, fdr, fwer, n_perm
+
+
+def _leading_edge(up, down, es, positions, starts, sizes, n):
+    # rank at the extreme of the running sum and the GSEA leading edge summary of every set
+    set_id = np.repeat(np.arange(len(starts)), sizes)
+    deviation = np.where(np.repeat(es >= 0, sizes), up, -down)
+    order = np.lexsort((-deviation, set_id))
+    best = order[starts]
+    rank_at_max = positions[best]
+    within = best - starts
+    tags = np.where(es >= 0, within + 1, sizes - within) / sizes.astype(np.float64)
+    listed = np.where(es >= 0, rank_at_max + 1, n - rank_at_max) / float(n)
+    signal = tags * (1 - listed) * n / (n - sizes).astype(np.float64)
+    edge = ["tags={:.0%}, list={:.0%}, signal={:.0%}".format(t, l, s) for t, l, s in zip(tags, listed, signal)]
+    return rank_at_max, edge
+
+
+def preranked_gsea(ranks, gene_sets, n_perm=1000, weight=1.0, min_size=15, max_size=500, processes=None, seed=0):
+    """
+
+    Preranked GSEA of every gene set on every ranked list with gene set permutations, the nulls of all the
+    lists are batched in a process pool
+
+    :param ranks: genes x signatures data frame of the ranking scores (e.g. log2FoldChange), or a Series
+    :param gene_sets: dict of gene set name to its genes, or a GeneSetCollection
+    :param n_perm: number of permutations
+    :param weight: the exponent of the scores in the running sum, 1 as the GSEA default (weighted)
+    :param min_size: the smallest gene set kept, counted on the ranked genes
+    :param max_size: the largest gene set kept
+    :param processes: number of worker processes, all cores if None
+    :param seed: random seed
+    :return: dict of signature to its result table in the GSEA report columns (NAME, SIZE, ES, NES, NOM p-val,
+             FDR q-val, FWER p-val, RANK AT MAX, LEADING EDGE), sorted by NES
+    """
+    if isinstance(ranks, pd.Series):
+        ranks = ranks.to_frame()
+    ranks = ranks.dropna()
+    n = len(ranks)
+    incidence, names = incidence_matrix(gene_sets, ranks.index)
+    sizes = np.diff(incidence.indptr)
+    keep = (sizes >= min_size) & (sizes <= max_size)
+    incidence = incidence[np.flatnonzero(keep)]
+    names = np.asarray(names, dtype=object)[keep]
+    sizes = sizes[keep]
+    starts = incidence.indptr[:-1].astype(np.int64)
+    incidence = incidence.tocsc()
+
+    # genes of every list in ranked order and the scores in that order
+    order = np.argsort(-ranks.values, axis=0, kind="mergesort")
+    sorted_scores = np.take_along_axis(ranks.values.astype(np.float64), order, axis=0)
+    print(len(names), "gene sets of", min_size, "to", max_size, "genes,", ranks.shape[1], "ranked lists")
+
+    chunk = max(1, n_perm // max(1, (processes or os.cpu_count() or 1)))
+    chunks = [min(chunk, n_perm - start) for start in range(0, n_perm, chunk)]
+    seeds = np.random.RandomState(seed).randint(0, 2 ** 31 - 1, size=len(chunks))
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(incidence, np.ascontiguousarray(sorted_scores.T), starts, sizes)) as executor:
+        nulls = np.concatenate(list(executor.map(_null_chunk, [(b, r, weight) for b, r in zip(chunks, seeds)])),
+                               axis=1)
+
+    results = {}
+    for j, signature in enumerate(ranks.columns):
+        # columns in ranked order, the CSR indices are the sorted rank positions of the set genes
+        positions = incidence[:, order[:, j]].tocsr().indices
+        weights = _weights(sorted_scores[:, j], positions, weight)
+        up, down = _running_sum(positions[None, :], weights[None, :], starts, sizes, n)
+        top = np.maximum.reduceat(up, starts, axis=1)[0]
+        bottom = np.minimum.reduceat(down, starts, axis=1)[0]
+        es = np.where(top >= -bottom, top, bottom)
+        nes, nominal, fdr, fwer, _ = _statistics(es, nulls[j])
+        rank_at_max, edge = _leading_edge(up[0], down[0], es, positions, starts, sizes, n)
+        table = pd.DataFrame({"SIZE": sizes, "ES": es, "NES": nes, "NOM p-val": nominal, "FDR q-val": fdr,
+                              "FWER p-val": fwer, "RANK AT MAX": rank_at_max, "LEADING EDGE": edge},
+                             index=pd.Index(names, name="NAME"))
+        results[signature] = table.sort_values("NES", ascending=False)
+    return results
+
+
+def write_reports(results, wd, prefix="gsea_preranked"):
+    """
+    write each result as a run directory <prefix>_<signature> with gsea_report_for_na_pos/na_neg files,
+    the layout read by gsea_index. The signature is <cancer>_<arm>_<condition> (e.g. BRCA0.2_8p_loss from
+    dge_batch.gsea_signature), its '.' are written as '-' since gsea_index cuts the run names at the first '.'
+    :param results: dict of signature to its result table from preranked_gsea
+    :param wd: the results directory
+    :param prefix: the prefix of the run directories, two '_' separated fields as the GSEA runs
+    """
+    for signature, table in results.items():
+        run_dir = join(wd, prefix + "_" + str(signature).replace(".", "-"))
+        if not os.path.exists(run_dir):
+            os.makedirs(run_dir)
+        table[table.ES >= 0].to_csv(join(run_dir, "gsea_report_for_na_pos.xls"), sep="\t")
+        table[table.ES < 0].sort_values("NES").to_csv(join(run_dir, "gsea_report_for_na_neg.xls"), sep="\t")
+    print(len(results), "GSEA reports written in", wd)
@@ -0,0 +1,168 @@
+"""
+Index of the GSEA results trees, every gsea_report_for_* file parsed once into one long table,
+cached on disk and re-parsed only when a report changes
+"""
+
+
+import os
+import numpy as np
+import pandas as pd
+from os.path import basename, getmtime, join
+from concurrent.futures import ThreadPoolExecutor
+
+
+POSITIVE_REPORTS = ("gsea_report_for_YES", "gsea_report_for_na_pos")
+NEGATIVE_REPORTS = ("gsea_report_for_NO", "gsea_report_for_na_neg")
+REPORT_COLUMNS = ["SIZE", "ES", "NES", "NOM p-val", "FDR q-val", "FWER p-val", "RANK AT MAX", "LEADING EDGE"]
+INDEX_COLUMNS = ["Run", "Group", "Cancer", "Arm", "Condition", "Phenotype", "GeneSet"] + REPORT_COLUMNS
+
+
+def run_fields(run):
+    """
+    the cancer, arm and condition of a GSEA run directory named <prefix>_<prefix>_<cancer>_<arm>_<condition>[...].<...>
+    :param run: name of the run directory
+    :return: (group, cancer, arm, condition), group is the '-' joined fields after the prefix
+    """
+    fields = basename(run.rstrip("/\\")).split(".")[0].split("_")[2:]
+    fields += [""] * (3 - len(fields))
+    return "-".join(x for x in fields if x), fields[0], fields[1], fields[2]
+
+
+def find_reports(wd):
+    """
+    walk a GSEA results tree once for the positive and negative report of every run
+    :param wd: the results directory
+    :return: dict of run directory to (positive report, negative report), either may be None
+    """
+    reports = {}
+    for root, dirs, files in os.walk(wd):
+        pos = [f for f in files if f.startswith(POSITIVE_REPORTS) and ".xls" in f]
+        neg = [f for f in files if f.startswith(NEGATIVE_REPORTS) and ".xls" in f]
+        if pos or neg:
+            reports[root] = (join(root, sorted(pos)[-1]) if pos else None,
+                             join(root, sorted(neg)[-1]) if neg else None)
+    return reports
+
+
+def read_report(report, phenotype):
+    """
+    one gsea_report_for_* file as rows of the index
+    :param report: path of the report (tab separated despite the .xls)
+    :param phenotype: "pos" or "neg"
+    :return: data frame with GeneSet, Phenotype and the report columns
+    """
+    df = pd.read_table(report, index_col=0)
+    df = df[[c for c in REPORT_COLUMNS if c in df.columns]].copy()
+    df.index = df.index.astype(str).str.strip()
+    df.index.name = "GeneSet"
+    df = df.reset_index()
+    df.insert(0, "Phenotype", phenotype)
+    return df
+
+
+def _parse_run(run, pos, neg):
+    frames = [read_report(report, phenotype) for report, phenotype in [(pos, "pos"), (neg, "neg")] if report]
+    df = pd.concat(frames, ignore_index=True)
+    group, cancer, arm, condition = run_fields(run)
+    df.insert(0, "Condition", condition)
+    df.insert(0, "Arm", arm)
+    df.insert(0, "Cancer", cancer)
+    df.insert(0, "Group", group)
+    df.insert(0, "Run", basename(run.rstrip("/\\")))
+    return df
+
+
+def _report_stamps(reports):
+    # the cache is valid while the same reports exist with the same modification times
+    return sorted((report, getmtime(report)) for pair in reports.values() for report in pair if report)
+
+
+def gsea_index(wd, cache_file="gsea_index.pkl", processes=None, refresh=False):
+    """
+
+    The long table (Run, Group, Cancer, Arm, Condition, Phenotype, GeneSet, SIZE, ES, NES, NOM p-val,
+    FDR q-val, ...) of every report under a GSEA results tree. The reports are parsed in a thread pool and
+    the table is cached in the tree, it is read back as long as no report was added, removed or modified
+
+    :param wd: the results directory
+    :param cache_file: name of the cache in wd, None to skip the cache
+    :param processes: number of worker threads
+    :param refresh: parse all the reports even if the cache is valid
+    :return: data frame of the index
+    """
+    reports = find_reports(wd)
+    stamps = _report_stamps(reports)
+    cache = join(wd, cache_file) if cache_file else None
+    if cache and not refresh and os.path.exists(cache):
+        cached_stamps, table = pd.read_pickle(cache)
+        if cached_stamps == stamps:
+            print("GSEA index of", len(reports), "runs read from cache.")
+            return table
+
+    runs = sorted(reports)
+    with ThreadPoolExecutor(max_workers=processes) as pool:
+        jobs = [pool.submit(_parse_run, run, *reports[run]) for run in runs]
+        frames = [job.result() for job in jobs]
+    if frames:
+        table = pd.concat(frames, ignore_index=True)
+    else:
+        table = pd.DataFrame(columns=INDEX_COLUMNS)
+    for col in ["Run", "Group", "Cancer", "Arm", "Condition", "Phenotype"]:
+        table[col] = table[col].astype("category")
+    print("GSEA index of", len(runs), "runs,", len(table), "gene set results")
+    if cache:
+        pd.to_pickle((stamps, table), cache)
+    return table
+
+
+def run_results(index, run, column=None):
+    """
+    the results of one run indexed by gene set, as the concat of its positive and negative reports
+    :param index: the GSEA index
+    :param run: run name
+    :param column: a single report column (e.g. NES) as a Series
+    :return: data frame (or Series) indexed by gene set
+    """
+    df = index[index["Run"] == run].set_index("GeneSet")
+    return df[column] if column else df
+
+
+def result_matrix(index, column="NES", key="Group"):
+    """
+    gene sets x runs matrix of a report column, one outer join of the results of every run
+    :param index: the GSEA index
+    :param column: the report column, NES by default
+    :param key: index column naming the runs in the matrix (Group or Run)
+    :return: data frame, NaN where a gene set is missing from a run
+    """
+    series = []
+    for name, df in index.groupby(key, observed=True, sort=True):
+        df = df.drop_duplicates("GeneSet", keep="last")
+        series.append(pd.Series(df[column].values, index=df["GeneSet"].values, name=name))
+    if not series:
+        return pd.DataFrame()
+    return pd.concat(series, axis=1, join="outer", sort=True).astype(float)
+
+
+def heatmap_matrix(index, gene_sets, column="NES", key="Group", row_key=None, column_key=None):
+    """
+
+    The gene sets x runs matrix of the requested gene sets, selected with one reindex of the result matrix
+    (gene sets missing from every run are NaN rows) and ordered by precomputed keys
+
+    :param index: the GSEA index
+    :param gene_sets: list of the gene set names, the rows in this order unless row_key is given
+    :param column: the report column, NES by default
+    :param key: index column naming the runs (Group or Run)
+    :param row_key: "mean" for decreasing mean over the runs, or a Series of sort keys of the gene sets
+    :param column_key: function of the run name giving its sort key
+    :return: data frame, gene sets x runs
+    """
+    matrix = result_matrix(index, column, key).reindex(pd.Index(gene_sets).str.strip())
+    if row_key is not None:
+        keys = -matrix.mean(axis=1) if isinstance(row_key, str) and row_key == "mean" else \
+            pd.Series(row_key).reindex(matrix.index)
+        matrix = matrix.iloc[np.argsort(keys.values, kind="mergesort")]
+    if column_key is not None:
+        matrix = matrix[sorted(matrix.columns, key=column_key)]
+    return matrix
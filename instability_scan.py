@@ -0,0 +1,81 @@
+"""
+Genome-wide association of the gene expression with the instability score (and the arm scores) of the samples,
+computed in chunks of genes as standardized matrix products and streamed to .npy files on disk
+"""
+
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from stat_utils import p_adjust_bh
+
+
+def _standardize_rows(values, method):
+    if method == "spearman":
+        values = stats.rankdata(values, axis=1)
+    centered = values - values.mean(axis=1)[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return centered / np.sqrt((centered ** 2).sum(axis=1))[:, None]
+
+
+def _chunk_correlation(expression, score, method):
+    # rows of expression and score standardized to unit norm: the correlation is their dot product
+    genes = _standardize_rows(np.asarray(expression, dtype=np.float64), method)
+    score = _standardize_rows(np.asarray(score, dtype=np.float64)[None, :], method)[0]
+    return genes.dot(score)
+
+
+def association_scan(expression, scores, out_prefix, method="spearman", chunk_size=2000):
+    """
+
+    Correlate every gene with every score over the samples present in both,
+    the correlations and p-values are written chunk by chunk into <out_prefix>_corr.npy, _pvalue.npy and _padj.npy
+
+    :param expression: genes x samples data frame
+    :param scores: samples x scores data frame (e.g. Aneuploidy.Iscore, arm_events.arm_scores), or a Series
+    :param out_prefix: prefix of the output files
+    :param method: pearson or spearman
+    :param chunk_size: number of genes per chunk
+    :return: the output prefix, read the results back with read_scan
+    """
+    if isinstance(scores, pd.Series):
+        scores = scores.to_frame()
+    samples = expression.columns.intersection(scores.index)
+    scores = scores.loc[samples]
+    n_genes, n_scores = expression.shape[0], scores.shape[1]
+    print("association scan:", n_genes, "genes x", n_scores, "scores over", len(samples), "samples")
+
+    corr = np.lib.format.open_memmap(out_prefix + "_corr.npy", mode="w+", dtype=np.float32, shape=(n_genes, n_scores))
+    p = np.lib.format.open_memmap(out_prefix + "_pvalue.npy", mode="w+", dtype=np.float64, shape=(n_genes, n_scores))
+    for k, score in enumerate(scores.columns):
+        used = scores[score].notnull().values
+        score_values = scores[score].values[used]
+        n = used.sum()
+        for start in range(0, n_genes, chunk_size):
+            rows = slice(start, min(start + chunk_size, n_genes))
+            chunk = expression.iloc[rows][samples].values[:, used]
+            r = np.clip(_chunk_correlation(chunk, score_values, method), -1.0, 1.0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                t = r * np.sqrt((n - 2) / (1.0 - r ** 2))
+            corr[rows, k] = r
+            p[rows, k] = 2 * stats.t.sf(np.abs(t), n - 2)
+    corr.flush()
+    p.flush()
+
+    padj = np.lib.format.open_memmap(out_prefix + "_padj.npy", mode="w+", dtype=np.float64, shape=(n_genes, n_scores))
+    for k in range(n_scores):
+        padj[:, k] = p_adjust_bh(p[:, k])
+    padj.flush()
+    pd.Series(expression.index).to_csv(out_prefix + "_genes.txt", index=False, header=False)
+    pd.Series(scores.columns).to_csv(out_prefix + "_scores.txt", index=False, header=False)
+    return out_prefix
+
+
+def read_scan(out_prefix, what="corr", mmap=True):
+    """
+    the corr, pvalue or padj matrix of a scan as a genes x scores data frame
+    """
+    values = np.load(out_prefix + "_" + what + ".npy", mmap_mode="r" if mmap else None)
+    genes = pd.read_csv(out_prefix + "_genes.txt", header=None)[0].values
+    scores = pd.read_csv(out_prefix + "_scores.txt", header=None)[0].values
+    return pd.DataFrame(values, index=genes, columns=scores)
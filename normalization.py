@@ -0,0 +1,131 @@
+"""
+Normalization of the RNA counts: median-of-ratios size factors (as DESeq2),
+log and variance-stabilizing transforms, cached on disk per cohort
+"""
+
+
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from os.path import join
+
+
+def _blocks(n, block_size):
+    for start in range(0, n, block_size):
+        yield slice(start, min(start + block_size, n))
+
+
+def size_factors(counts, block_size=5000):
+    """
+    median-of-ratios size factors of the samples, computed over float32 blocks of genes
+    :param counts: raw counts, genes x samples
+    :param block_size: number of genes per block
+    :return: Series of the size factors
+    """
+    values = np.asarray(counts)
+    log_counts = np.empty(values.shape, dtype=np.float32)
+    log_geo_means = np.empty(values.shape[0], dtype=np.float32)
+    with np.errstate(divide="ignore"):
+        for rows in _blocks(values.shape[0], block_size):
+            log_counts[rows] = np.log(values[rows].astype(np.float32))
+            log_geo_means[rows] = log_counts[rows].mean(axis=1)
+    # genes with a zero count in any sample have a geometric mean of 0 and are left out
+    used = np.isfinite(log_geo_means)
+    factors = np.exp(np.median(log_counts[used] - log_geo_means[used, None], axis=0))
+    return pd.Series(factors, index=getattr(counts, "columns", None), name="size_factor")
+
+
+def normalize_counts(counts, factors=None, block_size=5000):
+    """
+    counts divided by the size factors, float32
+    """
+    if factors is None:
+        factors = size_factors(counts, block_size)
+    values = np.asarray(counts)
+    scale = (1.0 / np.asarray(factors)).astype(np.float32)
+    normalized = np.empty(values.shape, dtype=np.float32)
+    for rows in _blocks(values.shape[0], block_size):
+        normalized[rows] = values[rows].astype(np.float32) * scale
+    return pd.DataFrame(normalized, index=counts.index, columns=counts.columns)
+
+
+def log_transform(counts, factors=None, pseudocount=1.0, block_size=5000):
+    """
+    log2(normalized counts + pseudocount)
+    """
+    normalized = normalize_counts(counts, factors, block_size)
+    return np.log2(normalized + np.float32(pseudocount))
+
+
+def dispersion_trend(normalized):
+    """
+    parametric dispersion trend a1/mean + a0 (as DESeq2), fitted to the method-of-moments dispersions
+    :param normalized: normalized counts, genes x samples
+    :return: asymptotic dispersion a0, extra-Poisson term a1
+    """
+    values = np.asarray(normalized, dtype=np.float64)
+    means = values.mean(axis=1)
+    variances = values.var(axis=1, ddof=1)
+    used = means > 0
+    dispersions = (variances[used] - means[used]) / means[used] ** 2
+    keep = np.isfinite(dispersions) & (dispersions > 1e-8)
+    if keep.sum() < 2:
+        return 0.0, 1.0
+    a1, a0 = np.polyfit(1.0 / means[used][keep], dispersions[keep], 1)
+    return max(a0, 1e-8), max(a1, 0.0)
+
+
+def vst(counts, factors=None, block_size=5000):
+    """
+    variance-stabilizing transform with the parametric dispersion trend (DESeq2 fitType="parametric"),
+    on the log2 scale for large counts
+    :param counts: raw counts, genes x samples
+    :param factors: size factors, computed if None
+    :return: data frame of the transformed values, float32
+    """
+    normalized = normalize_counts(counts, factors, block_size)
+    a0, a1 = dispersion_trend(normalized)
+    transformed = np.empty(normalized.shape, dtype=np.float32)
+    values = normalized.values.astype(np.float64)
+    for rows in _blocks(values.shape[0], block_size):
+        q = values[rows]
+        transformed[rows] = np.log2((1 + a1 + 2 * a0 * q + 2 * np.sqrt(a0 * q * (1 + a1 + a0 * q)))
+                                    / (4 * a0)) if a0 > 0 else np.log2(q + 1)
+    return pd.DataFrame(transformed, index=normalized.index, columns=normalized.columns)
+
+
+def data_hash(df):
+    """
+    hash of a data frame (values, index and columns), the cache key of the transforms
+    """
+    md5 = hashlib.md5()
+    md5.update(np.ascontiguousarray(np.asarray(df)).tobytes())
+    md5.update("|".join(map(str, df.index)).encode())
+    md5.update("|".join(map(str, df.columns)).encode())
+    return md5.hexdigest()[:16]
+
+
+TRANSFORMS = {"normalized": normalize_counts, "log": log_transform, "vst": vst}
+
+
+def cached_transform(counts, cohort, method="vst", cache_dir="norm_cache"):
+    """
+
+    The transform of the counts of a cohort, read from the cache if the same counts were transformed before
+
+    :param counts: raw counts, genes x samples
+    :param cohort: the cohort name, part of the cache file name
+    :param method: normalized, log or vst
+    :param cache_dir: the directory of the cached transforms
+    :return: data frame of the transformed values
+    """
+    cache_file = join(cache_dir, "{}_{}_{}.pkl".format(cohort, method, data_hash(counts)))
+    if os.path.exists(cache_file):
+        print(cohort, method, "read from cache.")
+        return pd.read_pickle(cache_file)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    transformed = TRANSFORMS[method](counts)
+    transformed.to_pickle(cache_file)
+    return transformed
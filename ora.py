@@ -0,0 +1,94 @@
+"""
+Over-representation of gene sets in query gene lists (e.g. the top and bottom DGE genes),
+the overlaps of all the gene sets with all the queries come from one sparse product
+"""
+
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from gene_sets import incidence_matrix
+from stat_utils import hypergeom_sf, p_adjust_bh
+
+
+def inverted_index(gene_sets, genes):
+    """
+    gene -> gene sets index, the transpose of the incidence matrix
+    :param gene_sets: dict of gene set name to its genes, or a GeneSetCollection
+    :param genes: the gene universe
+    :return: (csr matrix genes x gene sets, list of the gene set names)
+    """
+    incidence, names = incidence_matrix(gene_sets, genes)
+    return incidence.T.tocsr(), names
+
+
+def query_matrix(queries, genes):
+    """
+    indicator matrix of the query lists on the gene universe, genes outside the universe are left out
+    :param queries: dict of query name to its list of genes
+    :param genes: the gene universe
+    :return: (csr matrix genes x queries, list of the query names)
+    """
+    genes = pd.Index(genes)
+    names = list(queries.keys())
+    members = [pd.Index(queries[name]).unique() for name in names]
+    rows = np.concatenate([genes.get_indexer(m) for m in members]) if names else np.zeros(0, dtype=int)
+    cols = np.repeat(np.arange(len(names)), [len(m) for m in members])
+    found = rows >= 0
+    return csr_matrix((np.ones(found.sum()), (rows[found], cols[found])), shape=(len(genes), len(names))), names
+
+
+def top_bottom_queries(values, n=3000):
+    """
+    the top and bottom n genes of each signature as queries <signature>_up and <signature>_down
+    :param values: genes x signatures data frame, or a Series for a single ranking (queries up and down)
+    :param n: number of genes at each end
+    :return: dict of query name to its genes
+    """
+    if isinstance(values, pd.Series):
+        ordered = values.sort_values(ascending=False).index
+        return {"up": ordered[:n].tolist(), "down": ordered[len(ordered) - n:].tolist()}
+    queries = {}
+    for c in values.columns:
+        ordered = values[c].dropna().sort_values(ascending=False).index
+        queries[str(c) + "_up"] = ordered[:n].tolist()
+        queries[str(c) + "_down"] = ordered[len(ordered) - n:].tolist()
+    return queries
+
+
+def overrepresentation(gene_sets, queries, universe, min_overlap=1):
+    """
+
+    Hypergeometric over-representation of every gene set in every query list. The overlap counts of all the
+    pairs are one sparse product of the query matrix with the gene -> gene sets inverted index, the p-values
+    are computed together and adjusted (BH) within each query
+
+    :param gene_sets: dict of gene set name to its genes, or a GeneSetCollection
+    :param queries: dict of query name to its list of genes
+    :param universe: all the genes that could be in a query (e.g. the DGE gene index)
+    :param min_overlap: the smallest overlap reported
+    :return: long data frame Query, GeneSet, Overlap, SetSize, QuerySize, Fraction, pvalue, padj
+    """
+    universe = pd.Index(universe).unique()
+    inverted, set_names = inverted_index(gene_sets, universe)
+    query, query_names = query_matrix(queries, universe)
+    # each query gathers the gene set rows of its genes
+    overlaps = query.T.dot(inverted).T.toarray()
+    set_sizes = np.asarray(inverted.sum(axis=0)).ravel()
+    query_sizes = np.asarray(query.sum(axis=0)).ravel()
+
+    p = hypergeom_sf(overlaps, len(universe), set_sizes[:, None], query_sizes[None, :])
+    padj = p_adjust_bh(p, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = overlaps / set_sizes[:, None]
+
+    row, col = np.nonzero(overlaps >= min_overlap)
+    result = pd.DataFrame({"Query": np.asarray(query_names, dtype=object)[col],
+                           "GeneSet": np.asarray(set_names, dtype=object)[row],
+                           "Overlap": overlaps[row, col].astype(np.int64),
+                           "SetSize": set_sizes[row].astype(np.int64),
+                           "QuerySize": query_sizes[col].astype(np.int64),
+                           "Fraction": fraction[row, col],
+                           "pvalue": p[row, col],
+                           "padj": padj[row, col]})
+    return result.sort_values(["Query", "pvalue"], kind="mergesort").reset_index(drop=True)
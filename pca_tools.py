@@ -0,0 +1,113 @@
+"""
+PCA of the expression data for the PCA plots: full, randomized or incremental (column blocks) solvers,
+the fitted components are cached on disk by the hash of the data
+"""
+
+
+import os
+import numpy as np
+import pandas as pd
+from os.path import join
+from sklearn.decomposition import PCA, IncrementalPCA
+from normalization import data_hash
+
+
+class PCAResult:
+
+    """
+    The fitted PCA: the sample coordinates, the loadings and the explained variance ratio
+    """
+
+    def __init__(self, transformed, components, explained_variance_ratio, samples, features):
+        self.transformed = transformed
+        self.components_ = components
+        self.explained_variance_ratio_ = explained_variance_ratio
+        self.samples = list(samples)
+        self.features = list(features)
+
+    def loadings(self):
+        return pd.DataFrame(self.components_, index=["PC" + str(i + 1) for i in range(len(self.components_))],
+                            columns=self.features)
+
+
+def column_blocks(data, block_size=200):
+    """
+    the samples of the data in blocks, each block is a samples x features array
+    :param data: features x samples data frame, or the path of a tab separated file of it (read block by block)
+    :param block_size: number of samples per block
+    :return: generator of (sample names, samples x features array)
+    """
+    if isinstance(data, str):
+        header = pd.read_table(data, index_col=0, nrows=0).columns.tolist()
+        for start in range(0, len(header), block_size):
+            samples = header[start:start + block_size]
+            block = pd.read_table(data, index_col=0, usecols=[0] + list(range(start + 1, start + 1 + len(samples))))
+            yield samples, block.values.T.astype(np.float64)
+    else:
+        for start in range(0, data.shape[1], block_size):
+            block = data.iloc[:, start:start + block_size]
+            yield block.columns.tolist(), block.values.T.astype(np.float64)
+
+
+def _features(data):
+    if isinstance(data, str):
+        return pd.read_table(data, index_col=0, usecols=[0]).index.tolist()
+    return data.index.tolist()
+
+
+def _cache_key(data, n_components, whiten, solver):
+    if isinstance(data, str):
+        stat = os.stat(data)
+        key = "{}_{}_{}".format(os.path.basename(data), stat.st_size, int(stat.st_mtime))
+    else:
+        key = data_hash(data)
+    return "{}_{}_{}_{}".format(key, n_components, int(whiten), solver)
+
+
+def fit_pca(data, n_components=4, whiten=True, solver="auto", block_size=200, cache_dir="pca_cache", random_state=0):
+    """
+
+    PCA of the samples (columns) of the data
+
+    :param data: features x samples data frame (e.g. Aneuploidy.samples_target), or the path of a tab separated file
+    :param n_components: number of components
+    :param whiten: whiten the components as PCA(whiten=True)
+    :param solver: full, randomized (randomized SVD), incremental (fit on blocks of samples) or auto
+    :param block_size: number of samples per block of the incremental solver
+    :param cache_dir: directory of the cached fits, no caching if None
+    :param random_state: seed of the randomized solver
+    :return: PCAResult
+    """
+    if isinstance(data, str) and solver != "incremental":
+        data = pd.read_table(data, index_col=0)
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = join(cache_dir, "PCA_" + _cache_key(data, n_components, whiten, solver) + ".npz")
+        if os.path.exists(cache_file):
+            cached = np.load(cache_file, allow_pickle=True)
+            print("PCA read from cache:", cache_file)
+            return PCAResult(cached["transformed"], cached["components"], cached["explained_variance_ratio"],
+                             cached["samples"], cached["features"])
+
+    if solver == "incremental":
+        pca = IncrementalPCA(n_components=n_components, whiten=whiten)
+        for samples, block in column_blocks(data, block_size):
+            pca.partial_fit(block)
+        samples, transformed = [], []
+        for block_samples, block in column_blocks(data, block_size):
+            samples += block_samples
+            transformed.append(pca.transform(block))
+        transformed = np.vstack(transformed)
+    else:
+        pca = PCA(n_components=n_components, whiten=whiten, svd_solver=solver, random_state=random_state)
+        samples = data.columns.tolist()
+        transformed = pca.fit_transform(data.values.T)
+
+    result = PCAResult(transformed, pca.components_, pca.explained_variance_ratio_, samples, _features(data))
+    if cache_file is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        np.savez(cache_file, transformed=result.transformed, components=result.components_,
+                 explained_variance_ratio=result.explained_variance_ratio_,
+                 samples=np.array(result.samples, dtype=object), features=np.array(result.features, dtype=object))
+    return result
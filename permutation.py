@@ -0,0 +1,83 @@
+"""
+Label permutation test of the expression differences between the altered (YES) and normal (NO) samples,
+the permutations of each chunk are evaluated with matrix products in a process pool
+"""
+
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from stat_utils import p_adjust_bh
+
+
+_expression = None
+
+
+def _init_worker(expression):
+    global _expression
+    _expression = expression
+
+
+def group_statistics(expression, labels, stat="t"):
+    """
+    gene-wise statistics of many labelings at once
+    :param expression: genes x samples array
+    :param labels: labelings x samples 0/1 array, 1 for the altered samples
+    :param stat: "t" for the pooled-variance t statistic, "diff" for the difference of the means
+    :return: genes x labelings array
+    """
+    labels = np.asarray(labels, dtype=np.float64)
+    n_yes = labels.sum(axis=1)
+    n_no = labels.shape[1] - n_yes
+    total = expression.sum(axis=1)[:, None]
+    sum_yes = expression.dot(labels.T)
+    sum_no = total - sum_yes
+    diff = sum_yes / n_yes - sum_no / n_no
+    if stat == "diff":
+        return diff
+    total_sq = (expression ** 2).sum(axis=1)[:, None]
+    sq_yes = (expression ** 2).dot(labels.T)
+    sq_no = total_sq - sq_yes
+    rss = (sq_yes - sum_yes ** 2 / n_yes) + (sq_no - sum_no ** 2 / n_no)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return diff / np.sqrt(rss / (n_yes + n_no - 2) * (1.0 / n_yes + 1.0 / n_no))
+
+
+def _permutation_chunk(args):
+    labels, observed, n_perm, seed, stat = args
+    rng = np.random.RandomState(seed)
+    permuted = labels[np.argsort(rng.random_sample((n_perm, len(labels))), axis=1)]
+    null = group_statistics(_expression, permuted, stat)
+    return (np.abs(null) >= np.abs(observed)[:, None]).sum(axis=1)
+
+
+def permutation_test(expression, labels, n_perm=10000, chunk_size=500, stat="t", processes=None, seed=0):
+    """
+
+    Empirical p-values of the gene-wise YES vs NO statistics from label permutations
+
+    :param expression: genes x samples data frame, e.g. Aneuploidy.samples_target
+    :param labels: YES/NO label of each sample, e.g. the column of Aneuploidy.chr_category
+    :param n_perm: number of permutations
+    :param chunk_size: permutations evaluated per matrix product, bounds the memory (genes x chunk_size)
+    :param stat: "t" or "diff"
+    :param processes: number of worker processes, all cores if None
+    :param seed: random seed
+    :return: data frame of the observed statistic, the two-sided empirical p-value and its BH adjustment of each gene,
+             NaN p-values (left out of the adjustment) for the genes without a finite statistic, e.g. zero variance
+    """
+    labels = pd.Series(labels).reindex(expression.columns)
+    y = (labels == "YES").values.astype(np.float64)
+    values = np.asarray(expression, dtype=np.float64)
+    observed = group_statistics(values, y[None, :], stat)[:, 0]
+
+    chunks = [min(chunk_size, n_perm - start) for start in range(0, n_perm, chunk_size)]
+    seeds = np.random.RandomState(seed).randint(0, 2 ** 31 - 1, size=len(chunks))
+    tasks = [(y, observed, n, s, stat) for n, s in zip(chunks, seeds)]
+    exceed = np.zeros(len(observed))
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(values,)) as executor:
+        for counts in executor.map(_permutation_chunk, tasks):
+            exceed += counts
+    p_values = np.where(np.isfinite(observed), (exceed + 1) / (n_perm + 1), np.nan)
+    return pd.DataFrame({"statistic": observed, "p_value": p_values, "padj": p_adjust_bh(p_values)},
+                        index=expression.index)
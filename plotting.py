@@ -0,0 +1,214 @@
+"""
+Plotting helpers with one artist per group instead of one per point,
+and rendering of many figures in worker processes with the Agg backend
+"""
+
+
+import os
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pandas as pd
+from matplotlib import pyplot as plt
+from matplotlib.collections import PolyCollection
+from scipy.cluster import hierarchy
+from concurrent.futures import ProcessPoolExecutor
+from normalization import data_hash
+
+
+def group_scatter(ax, x, y, groups, colors, labels, markersize=8):
+    """
+    one scatter call for each group of points
+    :param ax: matplotlib axes
+    :param x: x coordinates of the points
+    :param y: y coordinates of the points
+    :param groups: group of each point
+    :param colors: dict of group to color
+    :param labels: dict of group to legend label
+    :param markersize: marker size in points, as in plt.plot
+    :return: list of the scatter artists, for the legend
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    groups = np.asarray(groups)
+    handles = []
+    for group in colors.keys():
+        selected = groups == group
+        if selected.any():
+            handles.append(ax.scatter(x[selected], y[selected], s=markersize ** 2, marker='o',
+                                      color=colors[group], alpha=1, label=labels[group]))
+    return handles
+
+
+def pca_figure(transformed, variance_ratio, groups, colors, labels, title, out_file, size=14, dpi=100):
+    """
+    PC1 vs PC2 scatter plot of the samples, saved to out_file
+    :param transformed: samples x components coordinates
+    :param variance_ratio: explained variance ratio of the components
+    :param groups: group of each sample
+    :param colors: dict of group to color
+    :param labels: dict of group to legend label
+    :param title: the title of the plot
+    :param out_file: the output image file
+    """
+    fig, ax = plt.subplots(figsize=(size, size))
+    handles = group_scatter(ax, transformed[:, 0], transformed[:, 1], groups, colors, labels)
+    ax.set_xlabel("PC1: " + str(round(variance_ratio[0], 3)))
+    ax.set_ylabel("PC2: " + str(round(variance_ratio[1], 3)))
+    ax.legend(loc='best', scatterpoints=1, handles=handles)
+    ax.set_title(title)
+    fig.savefig(out_file, dpi=dpi)
+    plt.close(fig)
+    return out_file
+
+
+def hinton(matrix, max_weight=None, ax=None):
+    """Draw Hinton diagram for visualizing a weight matrix, all the squares in one collection."""
+    ax = ax if ax is not None else plt.gca()
+
+    ax.patch.set_facecolor('lightgray')
+    ax.set_aspect('equal', 'box')
+    ax.xaxis.set_major_locator(plt.NullLocator())
+    ax.yaxis.set_major_locator(plt.NullLocator())
+
+    weights = np.asarray(matrix, dtype=np.float64)
+    x, y = np.indices(weights.shape)
+    x, y, w = x.ravel(), y.ravel(), weights.ravel()
+    half = np.sqrt(np.abs(w)) / 2
+    squares = np.stack([np.stack([x - half, y - half], axis=1), np.stack([x + half, y - half], axis=1),
+                        np.stack([x + half, y + half], axis=1), np.stack([x - half, y + half], axis=1)], axis=1)
+    colors = np.where(w > 0, 'red', 'blue')
+    ax.add_collection(PolyCollection(squares, facecolors=colors, edgecolors=colors))
+
+    nticks = weights.shape[0]
+    ax.xaxis.tick_top()
+    ax.set_xticks(range(nticks))
+    ax.set_xticklabels(list(matrix.columns), rotation=90)
+    ax.set_yticks(range(nticks))
+    ax.set_yticklabels(matrix.columns)
+    ax.grid(False)
+
+    ax.autoscale_view()
+    ax.invert_yaxis()
+
+
+def cluster_order(matrix, axis=0, method="average", metric="euclidean", cache_dir="linkage_cache"):
+    """
+    hierarchical clustering order of the rows (axis 0) or columns (axis 1), the linkage is cached on disk
+    by the hash of the matrix so re-rendering the same matrix doesn't cluster it again
+    :param matrix: data frame, NaN count as 0
+    :return: array of the positions in the leaf order
+    """
+    values = np.nan_to_num(np.asarray(matrix, dtype=np.float64))
+    values = values if axis == 0 else values.T
+    if values.shape[0] < 3:
+        return np.arange(values.shape[0])
+    cache_file = None
+    if cache_dir:
+        key = "{}_{}_{}_{}".format(data_hash(matrix), axis, method, metric)
+        cache_file = os.path.join(cache_dir, key + ".npy")
+        if os.path.exists(cache_file):
+            return np.load(cache_file)
+    order = hierarchy.leaves_list(hierarchy.linkage(values, method=method, metric=metric))
+    if cache_file:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        np.save(cache_file, order)
+    return order
+
+
+def downsample_rows(matrix, max_rows, how="mean"):
+    """
+    the rows in consecutive tiles of equal size, each tile aggregated (mean) or represented by its first row
+    :param matrix: data frame, already in the display order
+    :param max_rows: the largest number of rows kept
+    :return: data frame with at most max_rows rows, labelled by the first row of each tile
+    """
+    if len(matrix) <= max_rows:
+        return matrix
+    tile = int(np.ceil(len(matrix) / float(max_rows)))
+    starts = np.arange(0, len(matrix), tile)
+    if how == "mean":
+        values = np.asarray(matrix, dtype=np.float64)
+        present = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(present, values, 0.0), starts, axis=0)
+        counts = np.add.reduceat(present, starts, axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = np.where(counts > 0, sums / counts, np.nan)
+    else:
+        values = np.asarray(matrix, dtype=np.float64)[starts]
+    return pd.DataFrame(values, index=matrix.index[starts], columns=matrix.columns)
+
+
+def heatmap_figure(matrix, out_file, cluster_rows=True, cluster_cols=False, annotate_limit=400, max_rows=3000,
+                   tile="mean", cmap="RdBu_r", vmax=None, label_limit=150, dpi=150, cache_dir="linkage_cache"):
+    """
+
+    Heatmap of a gene sets (or genes) x signatures matrix (NES, log2FoldChange) drawn as one rasterized image
+    instead of one patch per cell. The rows (and columns) are put in the cached clustering order, the cells are
+    annotated only for small matrices and very tall matrices are drawn as aggregated tiles of rows
+
+    :param matrix: data frame, NaN are drawn blank
+    :param out_file: the output image file
+    :param cluster_rows: order the rows by hierarchical clustering
+    :param cluster_cols: order the columns by hierarchical clustering
+    :param annotate_limit: the largest number of cells annotated with their value
+    :param max_rows: the largest number of rows drawn, taller matrices are tiled
+    :param tile: "mean" aggregates the rows of a tile, "first" keeps its first row
+    :param vmax: the color scale limit, symmetric around 0, the largest absolute value if None
+    :param label_limit: the largest number of row labels drawn
+    :return: the matrix in the drawn order (before tiling)
+    """
+    if cluster_rows:
+        matrix = matrix.iloc[cluster_order(matrix, 0, cache_dir=cache_dir)]
+    if cluster_cols:
+        matrix = matrix.iloc[:, cluster_order(matrix, 1, cache_dir=cache_dir)]
+    shown = downsample_rows(matrix, max_rows, tile)
+    values = np.asarray(shown, dtype=np.float64)
+    if vmax is None:
+        vmax = np.nanmax(np.abs(values)) if np.isfinite(values).any() else 1.0
+
+    n_rows, n_cols = values.shape
+    fig, ax = plt.subplots(figsize=(min(4 + 0.5 * n_cols, 40), min(3 + 0.2 * min(n_rows, label_limit), 60)))
+    image = ax.imshow(np.ma.masked_invalid(values), aspect="auto", interpolation="nearest", cmap=cmap,
+                      vmin=-vmax, vmax=vmax, rasterized=True)
+    fig.colorbar(image, ax=ax, fraction=0.03)
+    ax.set_xticks(np.arange(n_cols))
+    ax.set_xticklabels([str(c) for c in shown.columns], rotation=90)
+    if n_rows <= label_limit:
+        ax.set_yticks(np.arange(n_rows))
+        ax.set_yticklabels([str(r) for r in shown.index])
+    else:
+        ax.set_yticks([])
+        ax.set_ylabel("{} rows{}".format(len(matrix), "" if len(shown) == len(matrix) else
+                                         ", tiles of {}".format(int(np.ceil(len(matrix) / float(max_rows))))))
+    if values.size <= annotate_limit:
+        rows, cols = np.nonzero(np.isfinite(values))
+        for r, c in zip(rows, cols):
+            ax.text(c, r, "{:.2f}".format(values[r, c]), ha="center", va="center", fontsize=8)
+    fig.tight_layout()
+    fig.savefig(out_file, dpi=dpi)
+    plt.close(fig)
+    return matrix
+
+
+def _init_worker():
+    matplotlib.use("Agg")
+
+
+def _render(job):
+    function, kwargs = job
+    return function(**kwargs)
+
+
+def render_figures(jobs, processes=None):
+    """
+    render the figures in worker processes
+    :param jobs: list of (module level plotting function, dict of keyword arguments), e.g. (pca_figure, {...})
+    :param processes: number of worker processes, all cores if None
+    :return: list of the return values of the jobs (the output files)
+    """
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as executor:
+        return list(executor.map(_render, jobs))
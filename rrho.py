@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Rank-rank hypergeometric overlap (RRHO) maps of two ranked lists,
+the overlaps of all the (i, j) steps come from a 2d prefix sum
+"""
+
+
+import numpy as np
+import pandas as pd
+from os.path import join
+from concurrent.futures import ThreadPoolExecutor
+from stat_utils import hypergeom_log_tail
+
+
+def overlap_counts(rank1, rank2, steps1, steps2):
+    """
+    number of genes in the top i of list 1 and the top j of list 2, for every i in steps1 and j in steps2
+    :param rank1: rank (1 = top) of each gene in list 1
+    :param rank2: rank of each gene in list 2
+    :param steps1: the cut offs of list 1
+    :param steps2: the cut offs of list 2
+    :return: len(steps1) x len(steps2) array of the overlaps
+    """
+    # bin of each gene on the grid, then a cumulative sum over both axes
+    bin1 = np.searchsorted(steps1, rank1, side="left")
+    bin2 = np.searchsorted(steps2, rank2, side="left")
+    inside = (bin1 < len(steps1)) & (bin2 < len(steps2))
+    counts = np.zeros((len(steps1), len(steps2)), dtype=np.int64)
+    np.add.at(counts, (bin1[inside], bin2[inside]), 1)
+    return counts.cumsum(axis=0).cumsum(axis=1)
+
+
+def rrho_map(list1, list2, step=100, signed=True):
+    """
+
+    RRHO map of two ranked lists of the same genes
+
+    :param list1: Series of gene scores (e.g. log2FoldChange), ranked from the largest
+    :param list2: Series of gene scores, only the genes in both lists are used
+    :param step: grid step in number of genes
+    :param signed: log10 p-values of enrichment signed negative for depletion (as the RRHO package)
+    :return: data frame of -log10 hypergeometric p-values, cut offs of list 1 x cut offs of list 2
+    """
+    genes = list1.index.intersection(list2.index)
+    n = len(genes)
+    rank1 = list1.loc[genes].rank(ascending=False, method="first").values
+    rank2 = list2.loc[genes].rank(ascending=False, method="first").values
+    steps = np.arange(step, n + 1, step)
+    return _log_p_map(overlap_counts(rank1, rank2, steps, steps), steps, steps, n, signed)
+
+
+def _log_p_map(counts, steps1, steps2, n, signed):
+    i = steps1[:, None]
+    j = steps2[None, :]
+    expected = i * j / float(n)
+    upper = counts >= expected
+    log_p = np.empty(counts.shape)
+    i, j = np.broadcast_arrays(i, j)
+    # each tail only where it is the side of the test, the tail sums converge quickly there
+    log_p[upper] = -hypergeom_log_tail(counts[upper], n, i[upper], j[upper], upper=True) / np.log(10)
+    depletion = -hypergeom_log_tail(counts[~upper], n, i[~upper], j[~upper], upper=False) / np.log(10)
+    log_p[~upper] = -depletion if signed else depletion
+    return pd.DataFrame(log_p, index=steps1, columns=steps2)
+
+
+def rrho_maps(df, pairs=None, step=100, signed=True):
+    """
+    RRHO maps of many pairs of ranked lists, each column of df is ranked once
+    :param df: genes x signatures data frame
+    :param pairs: list of (column 1, column 2), all the pairs if None
+    :return: dict of (column 1, column 2) to its map
+    """
+    df = df.dropna()
+    n = len(df)
+    ranks = df.rank(ascending=False, method="first").values
+    steps = np.arange(step, n + 1, step)
+    columns = df.columns.tolist()
+    if pairs is None:
+        pairs = [(columns[i], columns[j]) for i in range(len(columns)) for j in range(i + 1, len(columns))]
+    maps = {}
+    for c1, c2 in pairs:
+        counts = overlap_counts(ranks[:, columns.index(c1)], ranks[:, columns.index(c2)], steps, steps)
+        maps[(c1, c2)] = _log_p_map(counts, steps, steps, n, signed)
+    return maps
+
+
+def signature_pairs(columns):
+    """
+    all the (i, j) pairs of signatures with i before j, the order generate_rrho_file writes them
+    """
+    return [(i, j) for i in range(len(columns)) for j in range(i + 1, len(columns))]
+
+
+def write_rrho_pairs(df, path, pairs=None):
+    """
+
+    Rank each signature once and write all the pairs to one binary container (.npz): the genes, values and
+    ranks are stored once per signature and the pair table partitions them, read_rrho_pairs gives the long
+    format of any pair
+
+    :param df: genes x signatures data frame
+    :param path: output .npz file
+    :param pairs: list of (i, j) column positions, all the pairs if None
+    :return: the path
+    """
+    columns = df.columns.tolist()
+    ranks = df.rank(ascending=False).values
+    if not np.isnan(ranks).any():
+        ranks = ranks.astype(np.int32)
+    pairs = np.asarray(signature_pairs(columns) if pairs is None else pairs, dtype=np.int32).reshape(-1, 2)
+    np.savez(path, genes=np.asarray(df.index, dtype=str), signatures=np.asarray(columns, dtype=str),
+             values=df.values.astype(np.float64), ranks=ranks, pairs=pairs)
+    print(len(pairs), "RRHO pairs of", len(columns), "signatures written to", path)
+    return path
+
+
+def read_rrho_pairs(path, pairs=None):
+    """
+    long format (Pair, Gene, Rank_1, Rank_2, Value_1, Value_2) of the pairs in a write_rrho_pairs container
+    :param path: .npz file
+    :param pairs: list of (i, j) column positions, all the stored pairs if None
+    :return: data frame with a categorical Pair column "<signature i>-<signature j>"
+    """
+    with np.load(path) as data:
+        genes, signatures = data["genes"], data["signatures"]
+        values, ranks = data["values"], data["ranks"]
+        pairs = data["pairs"] if pairs is None else np.asarray(pairs, dtype=np.int32).reshape(-1, 2)
+    n = len(genes)
+    first, second = pairs[:, 0], pairs[:, 1]
+    names = [signatures[i] + "-" + signatures[j] for i, j in pairs]
+    return pd.DataFrame({"Pair": pd.Categorical.from_codes(np.repeat(np.arange(len(pairs)), n), names),
+                         "Gene": np.tile(genes, len(pairs)),
+                         "Rank_1": ranks[:, first].T.ravel(), "Rank_2": ranks[:, second].T.ravel(),
+                         "Value_1": values[:, first].T.ravel(), "Value_2": values[:, second].T.ravel()})
+
+
+def _write_pair_tsv(genes, signatures, values, ranks, wd, i, j):
+    name_i, name_j = str(signatures[i]), str(signatures[j])
+    rrho_file = pd.DataFrame({"Unigene": "N/A", "Gene": genes,
+                              name_j + "_rank": ranks[:, j], name_i + "_rank": ranks[:, i],
+                              name_j: values[:, j], name_i: values[:, i]},
+                             columns=["Unigene", "Gene", name_j + "_rank", name_i + "_rank", name_j, name_i])
+    output_fo = join(wd, "RRHO_" + name_i + "-" + name_j + ".txt")
+    rrho_file.to_csv(output_fo, sep="\t", index=False)
+    return output_fo
+
+
+def export_rrho_tsv(path, wd, processes=None):
+    """
+    write the pairs of a write_rrho_pairs container as the RRHO_<i>-<j>.txt input files of the RRHO tool
+    :param path: .npz file
+    :param wd: output directory
+    :param processes: number of worker threads
+    :return: list of the files written
+    """
+    with np.load(path) as data:
+        genes, signatures = data["genes"], data["signatures"]
+        values, ranks, pairs = data["values"], data["ranks"], data["pairs"]
+    with ThreadPoolExecutor(max_workers=processes) as pool:
+        jobs = [pool.submit(_write_pair_tsv, genes, signatures, values, ranks, wd, i, j) for i, j in pairs]
+        files = [job.result() for job in jobs]
+    print(len(files), "RRHO files generated in", wd)
+    return files
@@ -0,0 +1,79 @@
+"""
+Shared statistics helpers for the vectorized analyses
+"""
+
+
+import numpy as np
+from scipy import special
+
+
+def p_adjust_bh(p_values, axis=0):
+    """
+    Benjamini-Hochberg adjusted p-values (same as p.adjust(method="BH") in R), NaN are left out
+    :param p_values: array of p-values, adjusted separately along the axis if 2d
+    :param axis: the axis of the tests
+    :return: array of the adjusted p-values with the same shape
+    """
+    p = np.asarray(p_values, dtype=np.float64)
+    if p.ndim > 1:
+        return np.apply_along_axis(p_adjust_bh, axis, p)
+    padj = np.full(p.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(p))
+    n = len(valid)
+    if n == 0:
+        return padj
+    order = valid[np.argsort(p[valid])]
+    ranked = p[order] * n / np.arange(1, n + 1)
+    padj[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1.0)
+    return padj
+
+
+def hypergeom_log_tail(k, n, K, N, upper=True, max_terms=100000):
+    """
+    natural log of the hypergeometric tail P(X >= k) (upper) or P(X <= k) (lower), X the overlap of
+    N draws with K successes out of n, summed as ratios of neighbouring terms from the fast log pmf,
+    accurate far in the tails where scipy's logsf is slow
+    """
+    k, n, K, N = np.broadcast_arrays(*[np.asarray(x, dtype=np.float64) for x in (k, n, K, N)])
+    log_p0 = (special.gammaln(K + 1) - special.gammaln(k + 1) - special.gammaln(K - k + 1)
+              + special.gammaln(n - K + 1) - special.gammaln(N - k + 1) - special.gammaln(n - K - N + k + 1)
+              - special.gammaln(n + 1) + special.gammaln(N + 1) + special.gammaln(n - N + 1))
+    total = np.ones(k.shape)
+    term = np.ones(k.shape)
+    x = k.copy()
+    for it in range(max_terms):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if upper:
+                ratio = (K - x) * (N - x) / ((x + 1) * (n - K - N + x + 1))
+                x = x + 1
+            else:
+                ratio = x * (n - K - N + x) / ((K - x + 1) * (N - x + 1))
+                x = x - 1
+        term = term * np.where(np.isfinite(ratio), np.maximum(ratio, 0.0), 0.0)
+        total += term
+        if not np.any(term > 1e-15 * total):
+            break
+    return log_p0 + np.log(total)
+
+
+def hypergeom_sf(k, n, K, N):
+    """
+    hypergeometric P(X >= k), the over-representation p-value of an overlap of k, from the tail on the
+    side of the mean where the term sums converge
+    :param k: observed overlaps
+    :param n: universe size
+    :param K: gene set sizes
+    :param N: query sizes
+    :return: array of the p-values
+    """
+    k, n, K, N = np.broadcast_arrays(*[np.asarray(x, dtype=np.float64) for x in (k, n, K, N)])
+    p = np.ones(k.shape)
+    above = k > K * N / np.maximum(n, 1)
+    if above.any():
+        p[above] = np.exp(hypergeom_log_tail(k[above], n[above], K[above], N[above], upper=True))
+    below = ~above & (k > 0)
+    if below.any():
+        lower = np.exp(hypergeom_log_tail(k[below] - 1, n[below], K[below], N[below], upper=False))
+        # below the support of X the lower tail is 0
+        p[below] = np.clip(1.0 - np.nan_to_num(lower), 0.0, 1.0)
+    return p